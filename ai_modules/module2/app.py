@@ -8,10 +8,25 @@ import os
 import json
 import requests
 import logging
-from flask import Flask, request, jsonify
-from transformers import pipeline
+import threading
+import time
+import uuid
+import sqlite3
+import glob
+import functools
+import importlib
+import contextvars
+import gc
+import ctypes
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import Flask, request, jsonify, Response, stream_with_context
+from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
 import argostranslate.package
+import argostranslate.settings
 import argostranslate.translate
+import ctranslate2
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,177 +35,1122 @@ logging.getLogger("transformers").setLevel(logging.ERROR)
 
 # --- 1. CONFIGURATION ---
 ID_SENT = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+# Sentiment backend: "pytorch" (fp32), "int8" (dynamic-quantized PyTorch) or "onnx" (ONNX Runtime)
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "pytorch").lower()
+SENTIMENT_ONNX_DIR = os.getenv("SENTIMENT_ONNX_DIR", "models/sentiment-onnx")
+SENTIMENT_PARITY_CHECK = os.getenv("SENTIMENT_PARITY_CHECK", "true").lower() == "true"
+# Startup mode: "offline" only uses models pre-baked into the image (no downloads) and loads
+# them in parallel threads in the background, so /ready flips once they are in
+STARTUP_MODE = os.getenv("STARTUP_MODE", "default").lower()
+OFFLINE_STARTUP = STARTUP_MODE == "offline"
+# Only load Hugging Face models from the local cache (no hub downloads)
+MODELS_LOCAL_ONLY = os.getenv("MODELS_LOCAL_ONLY", "false").lower() == "true" or OFFLINE_STARTUP
 OLLAMA_URL = os.getenv("OLLAMA_URL")
+# Seconds between background Ollama reachability probes (0 probes only at startup)
+OLLAMA_PROBE_INTERVAL = float(os.getenv("OLLAMA_PROBE_INTERVAL", 60))
 OLLAMA_MODEL = "mistral:7b-instruct"
+OLLAMA_OPTIONS = {"temperature": 0.3, "max_tokens": 100, "top_p": 0.9}
+# Keep the model resident between comments instead of reloading it for each summary
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Devanagari sentences are translated in batches of this size
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", 8))
+# "0" translates in-process, "auto" uses one worker process per CPU
+TRANSLATION_WORKERS = os.getenv("TRANSLATION_WORKERS", "0")
+# Comments shorter than this (in words) get an extractive summary instead of an Ollama call
+SHORT_COMMENT_WORDS = int(os.getenv("SHORT_COMMENT_WORDS", 25))
+
+DEVANAGARI_RE = re.compile(r'[\u0900-\u097F]')
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[।॥.!?])\s+|\n+')
+
+# Model calls (sentiment, in-process translation) run on a dedicated inference executor with a
+# fixed torch thread budget, so concurrent request threads don't oversubscribe the cores
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 1))
+TORCH_INTRA_OP_THREADS = int(os.getenv("TORCH_INTRA_OP_THREADS", max(1, (os.cpu_count() or 1) // INFERENCE_WORKERS)))
+TORCH_INTER_OP_THREADS = int(os.getenv("TORCH_INTER_OP_THREADS", 1))
+
+# Idle-model eviction: unload models unused for MODEL_IDLE_TTL seconds, or least recently used
+# ones while RSS is over MEMORY_BUDGET_MB (0 disables either); they reload from disk on next use
+MODEL_IDLE_TTL = float(os.getenv("MODEL_IDLE_TTL", 0))
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", 0))
+MODEL_REAP_INTERVAL = float(os.getenv("MODEL_REAP_INTERVAL", 30))
+
+# Post context registry: extra post files, LRU size and file watch interval (0 disables watching)
+POSTS_DIR = os.getenv("POSTS_DIR", "posts")
+POST_CACHE_SIZE = int(os.getenv("POST_CACHE_SIZE", 32))
+POST_WATCH_INTERVAL = float(os.getenv("POST_WATCH_INTERVAL", 10))
+
+# Async job API: SQLite job store, bounded worker pool and queue limit
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", 500))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", 1000))  # finished/failed/rejected jobs kept for polling
+
+# Bulk NDJSON analysis: comments per translation/sentiment batch, concurrent Ollama summaries
+# and the cap on comments read but not yet written back (bounds memory)
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 32))
+BULK_SUMMARY_WORKERS = int(os.getenv("BULK_SUMMARY_WORKERS", 4))
+BULK_MAX_IN_FLIGHT = int(os.getenv("BULK_MAX_IN_FLIGHT", 128))
 
 # --- 2. GLOBAL MODEL LOADING PORT---
 MODELS = {}
+STARTUP = {"ready": False, "error": None, "phases": {}, "total_s": None}
 
-def load_models():
+def timed_phase(name, func):
+    """Run one startup phase, recording its duration in STARTUP['phases']"""
+    start = time.perf_counter()
     try:
-        print("🔧 Loading models...")
-        
-        # 1. Translation (ArgosTranslate for Hindi -> English)
-        print("   - Setting up ArgosTranslate for Hindi -> English")
-        
-        # Check if Hindi-English package is installed
-        installed_packages = argostranslate.package.get_installed_packages()
-        hindi_to_english = any(pkg.from_code == "hi" and pkg.to_code == "en" for pkg in installed_packages)
-        
-        if not hindi_to_english:
-            print("     - Installing Hindi-English translation package...")
-            available_packages = argostranslate.package.get_available_packages()
-            package_to_install = next(
-                (pkg for pkg in available_packages if pkg.from_code == "hi" and pkg.to_code == "en"), None
-            )
-            if package_to_install:
-                argostranslate.package.install_from_path(package_to_install.download())
-                print("     - Hindi-English package installed")
-            else:
-                print("     - ⚠️ Hindi-English package not found")
+        return func()
+    finally:
+        STARTUP['phases'][name] = round(time.perf_counter() - start, 3)
+
+_inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+def configure_torch_threads():
+    """Apply the torch thread budget (must run before the first model call)"""
+    import torch
+    torch.set_num_threads(TORCH_INTRA_OP_THREADS)
+    try:
+        torch.set_num_interop_threads(TORCH_INTER_OP_THREADS)
+    except RuntimeError as e:
+        # Can only be set once, before any inter-op parallel work has started
+        print(f"   - ⚠️ Could not set torch inter-op threads: {e}")
+    MODELS['torch_threads'] = {"intra_op": torch.get_num_threads(), "inter_op": torch.get_num_interop_threads()}
+
+def run_inference(func, *args, **kwargs):
+    """Run a model call on the inference executor and wait for it"""
+    if threading.current_thread().name.startswith("inference"):
+        return func(*args, **kwargs)
+    return _inference_executor.submit(func, *args, **kwargs).result()
+
+# Evictable models: MODELS[name] is None while unloaded and is reloaded by acquire_model
+MANAGED_MODELS = {}
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def tensor_bytes(value):
+    """Bytes held by a tensor, or by the tensors in a (packed-params) tuple"""
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_bytes(v) for v in value)
+    if hasattr(value, "element_size") and hasattr(value, "nelement"):
+        return value.element_size() * value.nelement()
+    return 0
+
+def model_footprint_mb(model):
+    """Weight footprint of a loaded model: torch tensors (incl. int8 packed weights), the ONNX
+    graph or the CTranslate2 model files; None when it cannot be told"""
+    inner = getattr(model, "model", model)  # transformers pipeline -> model
+    if hasattr(inner, "state_dict"):
+        return round(sum(tensor_bytes(v) for v in inner.state_dict().values()) / 2**20, 1)
+    path = getattr(inner, "model_path", None)  # optimum ORTModel
+    pkg = getattr(model, "pkg", None)          # Argos package translation
+    if path is None and pkg is not None:
+        path = os.path.join(str(pkg.package_path), "model")
+    if path is None or not os.path.exists(path):
+        return None
+    if os.path.isfile(path):
+        return round(os.path.getsize(path) / 2**20, 1)
+    return round(sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(path) for f in fs) / 2**20, 1)
+
+_load_lock = threading.Lock()
+_loads = {"active": 0, "started": 0}  # RSS deltas only mean something for loads that ran alone
+
+def register_model(name, reload):
+    """Make MODELS[name] evictable; `reload` rebuilds it from local disk"""
+    MANAGED_MODELS[name] = {
+        "reload": reload, "lock": threading.Lock(), "last_used": None, "loads": 0,
+        "unloads": 0, "load_s": None, "resident_mb": None, "last_unload_reason": None
+    }
+
+def load_managed_model(name, loader=None):
+    """(Re)load a managed model, recording load time and its memory footprint (the model's own
+    weights when they can be measured, else the RSS it added if no other load overlapped)"""
+    entry = MANAGED_MODELS[name]
+    with _load_lock:
+        _loads["active"] += 1
+        _loads["started"] += 1
+        alone, started = _loads["active"] == 1, _loads["started"]
+    try:
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        MODELS[name] = (loader or entry["reload"])()
+        rss_after = current_rss_mb()
+    finally:
+        with _load_lock:
+            _loads["active"] -= 1
+            alone = alone and _loads["started"] == started
+    entry["load_s"] = round(time.perf_counter() - start, 3)
+    resident_mb = model_footprint_mb(MODELS[name]) if MODELS[name] is not None else None
+    if resident_mb is None and alone and rss_before and rss_after:
+        resident_mb = round(max(0.0, rss_after - rss_before), 1)
+    entry["resident_mb"] = resident_mb
+    entry["loads"] += 1
+    entry["last_used"] = time.time()
+    return MODELS[name]
+
+def acquire_model(name):
+    """Return a managed model, reloading it lazily if it was evicted"""
+    entry = MANAGED_MODELS.get(name)
+    if entry is None:
+        return MODELS[name]
+    with entry["lock"]:
+        model = MODELS.get(name)
+        if model is None:
+            print(f"   - Reloading evicted model: {name}")
+            model = load_managed_model(name)
+        entry["last_used"] = time.time()
+        return model
+
+def unload_model(name, reason):
+    entry = MANAGED_MODELS[name]
+    with entry["lock"]:
+        if MODELS.get(name) is None:
+            return
+        MODELS[name] = None
+        entry["unloads"] += 1
+        entry["last_unload_reason"] = reason
+    gc.collect()
+    try:
+        # Hand freed heap pages back to the OS so RSS actually drops
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    print(f"   - Unloaded model {name} ({reason})")
+
+def reap_idle_models():
+    """Unload models idle past MODEL_IDLE_TTL, then LRU models while over MEMORY_BUDGET_MB"""
+    now = time.time()
+    loaded = [name for name in MANAGED_MODELS if MODELS.get(name) is not None]
+    if MODEL_IDLE_TTL > 0:
+        for name in loaded:
+            last_used = MANAGED_MODELS[name]["last_used"]
+            if last_used and now - last_used > MODEL_IDLE_TTL:
+                unload_model(name, "idle")
+    if MEMORY_BUDGET_MB > 0:
+        for name in sorted(loaded, key=lambda n: MANAGED_MODELS[n]["last_used"] or 0):
+            rss = current_rss_mb()
+            if rss is None or rss <= MEMORY_BUDGET_MB:
+                break
+            unload_model(name, "memory budget")
+
+def watch_model_memory():
+    while True:
+        time.sleep(MODEL_REAP_INTERVAL)
+        reap_idle_models()
+
+def model_memory_report():
+    return {
+        "rss_mb": round(current_rss_mb() or 0, 1),
+        "memory_budget_mb": MEMORY_BUDGET_MB,
+        "idle_ttl_s": MODEL_IDLE_TTL,
+        "models": {
+            name: {
+                "loaded": MODELS.get(name) is not None,
+                "last_used": entry["last_used"],
+                "loads": entry["loads"],
+                "unloads": entry["unloads"],
+                "last_load_s": entry["load_s"],
+                "resident_mb": entry["resident_mb"],
+                "last_unload_reason": entry["last_unload_reason"]
+            }
+            for name, entry in MANAGED_MODELS.items()
+        }
+    }
+
+def start_translation_pool():
+    """Fork the translation pool; called before any thread (watchers, loaders, torch) is started"""
+    workers = (os.cpu_count() or 1) if TRANSLATION_WORKERS == "auto" else int(TRANSLATION_WORKERS)
+    if workers > 0:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+        pool.submit(len, "").result()
+        MODELS['translation_pool'] = pool
+        MODELS['translation_workers'] = workers
+        print(f"     - Translation pool started with {workers} workers")
+
+def setup_translation():
+    """ArgosTranslate for Hindi -> English (downloads the package unless in offline mode)"""
+    print("   - Setting up ArgosTranslate for Hindi -> English")
+    
+    # Check if Hindi-English package is installed
+    installed_packages = argostranslate.package.get_installed_packages()
+    hindi_to_english = any(pkg.from_code == "hi" and pkg.to_code == "en" for pkg in installed_packages)
+    
+    if hindi_to_english:
+        print("     - Hindi-English package already installed")
+    elif OFFLINE_STARTUP:
+        print("     - ⚠️ Hindi-English package not baked into the image (offline mode, not downloading)")
+    else:
+        print("     - Installing Hindi-English translation package...")
+        available_packages = argostranslate.package.get_available_packages()
+        package_to_install = next(
+            (pkg for pkg in available_packages if pkg.from_code == "hi" and pkg.to_code == "en"), None
+        )
+        if package_to_install:
+            argostranslate.package.install_from_path(package_to_install.download())
+            print("     - Hindi-English package installed")
         else:
-            print("     - Hindi-English package already installed")
+            print("     - ⚠️ Hindi-English package not found")
 
-        # 2. Test Ollama connection
-        print("   - Testing Ollama connection...")
-        try:
-            test_url = OLLAMA_URL.replace('/api/generate', '/api/tags')
-            test_response = requests.get(test_url, timeout=5)
-            if test_response.status_code == 200:
-                print("   - ✅ Ollama connection successful")
-                MODELS['ollama_available'] = True
-            else:
-                print("   - ⚠️ Ollama connection failed, will use fallback")
-                MODELS['ollama_available'] = False
-        except Exception as e:
+    # Resolve the hi->en translation object once and keep it (until evicted)
+    register_model('translator', load_hi_en_translation)
+    MODELS['translation_available'] = load_managed_model('translator') is not None
+    if not MODELS['translation_available']:
+        print("     - ⚠️ Hindi-English translation unavailable")
+
+def probe_ollama():
+    """Check Ollama is reachable (a cheap /api/tags call, no prompt evaluation)"""
+    was_available = MODELS.get('ollama_available', False)
+    try:
+        test_url = OLLAMA_URL.replace('/api/generate', '/api/tags')
+        available = requests.get(test_url, timeout=5).status_code == 200
+    except Exception as e:
+        if was_available or 'ollama_available' not in MODELS:
             print(f"   - ⚠️ Ollama connection error: {e}")
-            MODELS['ollama_available'] = False
+        available = False
 
-        # 3. Sentiment (Twitter RoBERTa)
-        print(f"   - Loading Sentiment: {ID_SENT}")
-        MODELS['sent_pipeline'] = pipeline("text-classification", model=ID_SENT, device=-1, max_length=512, truncation=True)
-        
-        print("✅ All Models Loaded Successfully.")
+    MODELS['ollama_available'] = available
+    MODELS['ollama_checked_at'] = time.time()
+    if available and not was_available:
+        print("   - ✅ Ollama connection successful")
+    elif was_available and not available:
+        print("   - ⚠️ Ollama became unreachable, will use fallback")
+    return available
+
+def watch_ollama():
+    """Background loop re-probing Ollama so it can come and go after boot"""
+    while True:
+        time.sleep(OLLAMA_PROBE_INTERVAL)
+        probe_ollama()
+
+def resolve_sentiment_backend(backend):
+    """The onnx backend needs optimum[onnxruntime] (Docker build arg INSTALL_ONNX=1); without it use int8"""
+    if backend == "onnx":
+        try:
+            importlib.import_module("optimum.onnxruntime")
+        except ImportError as e:
+            print(f"   - ⚠️ SENTIMENT_BACKEND=onnx needs optimum[onnxruntime] ({e}); falling back to int8")
+            return "int8"
+    return backend
+
+def load_sentiment():
+    """Sentiment (Twitter RoBERTa)"""
+    backend = MODELS['sentiment_backend'] = resolve_sentiment_backend(SENTIMENT_BACKEND)
+    print(f"   - Loading Sentiment: {ID_SENT} ({backend})")
+    register_model('sent_pipeline', lambda: build_sentiment_pipeline(backend, local_only=True))
+    load_managed_model('sent_pipeline', lambda: build_sentiment_pipeline(backend))
+    if backend != "pytorch" and SENTIMENT_PARITY_CHECK:
+        MODELS['sentiment_parity'] = check_sentiment_parity(MODELS['sent_pipeline'])
+        print(f"   - Sentiment parity vs fp32: {MODELS['sentiment_parity']}")
+
+def load_models():
+    try:
+        print(f"🔧 Loading models ({STARTUP_MODE} startup)...")
+        start = time.perf_counter()
+        timed_phase("torch_threads", configure_torch_threads)
+
+        phases = {"translation": setup_translation, "ollama_probe": probe_ollama, "sentiment": load_sentiment}
+        if OFFLINE_STARTUP:
+            with ThreadPoolExecutor(max_workers=len(phases), thread_name_prefix="model-loader") as loader:
+                futures = [loader.submit(timed_phase, name, func) for name, func in phases.items()]
+                for future in futures:
+                    future.result()
+        else:
+            for name, func in phases.items():
+                timed_phase(name, func)
+
+        STARTUP['total_s'] = round(time.perf_counter() - start, 3)
+        STARTUP['ready'] = True
+        print(f"✅ All Models Loaded Successfully in {STARTUP['total_s']}s {STARTUP['phases']}")
         
     except Exception as e:
+        STARTUP['error'] = str(e)
         print(f"❌ Critical Model Load Error: {e}")
         raise e
 
-with open('post.json', 'r') as f:
-    POST_DATA = json.load(f)[0] # Assuming single post for demo
+def build_sentiment_pipeline(backend, local_only=MODELS_LOCAL_ONLY):
+    """Build the RoBERTa sentiment pipeline on the requested backend"""
+    tokenizer = AutoTokenizer.from_pretrained(ID_SENT, local_files_only=local_only)
+
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        if os.path.isdir(SENTIMENT_ONNX_DIR):
+            model = ORTModelForSequenceClassification.from_pretrained(SENTIMENT_ONNX_DIR)
+        else:
+            # Export once from the cached checkpoint and keep the ONNX graph for the next boot
+            model = ORTModelForSequenceClassification.from_pretrained(ID_SENT, export=True, local_files_only=local_only)
+            model.save_pretrained(SENTIMENT_ONNX_DIR)
+        return pipeline("text-classification", model=model, tokenizer=tokenizer, max_length=512, truncation=True)
 
-# Create a quick lookup dictionary: "Q1" -> "Suggest specific changes..."
-CLAUSE_MAP = {c['id']: c['text'] for c in POST_DATA['clauses']}
-DRAFT_TITLE = POST_DATA['title']
+    if backend not in ("pytorch", "int8"):
+        raise ValueError(f"Unknown SENTIMENT_BACKEND: {backend}")
 
-# --- 3. CORE PROCESSING LOGIC ---
+    model = AutoModelForSequenceClassification.from_pretrained(ID_SENT, local_files_only=local_only)
+    model.eval()
+    if backend == "int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline("text-classification", model=model, tokenizer=tokenizer, device=-1, max_length=512, truncation=True)
 
-def detect_and_translate(text):
-    """ArgosTranslate translation from Hindi to English"""
-    if not text:
-        return "", "English"
+def check_sentiment_parity(backend_pipeline):
+    """Compare backend labels and batch latency against the fp32 model on the bundled sample"""
+    with open('sentiment_sample.json', 'r') as f:
+        samples = json.load(f)
+
+    def timed_labels(pipe):
+        pipe(samples[:2])  # warm-up
+        start = time.perf_counter()
+        labels = [r['label'] for r in pipe(samples, batch_size=len(samples))]
+        return labels, (time.perf_counter() - start) * 1000
 
-    if re.search(r'[\u0900-\u097F]', text):
+    reference = build_sentiment_pipeline("pytorch")
+    ref_labels, ref_ms = timed_labels(reference)
+    del reference
+    labels, backend_ms = timed_labels(backend_pipeline)
+
+    agreement = sum(a == b for a, b in zip(ref_labels, labels)) / len(samples)
+    return {
+        "samples": len(samples),
+        "label_agreement": round(agreement, 4),
+        "fp32_batch_ms": round(ref_ms, 1),
+        "backend_batch_ms": round(backend_ms, 1),
+        "speedup": round(ref_ms / backend_ms, 2) if backend_ms else None
+    }
+
+# --- 3. POST CONTEXT REGISTRY ---
+# Clause/draft context for every consultation, keyed by postId. post.json and any JSON file in
+# POSTS_DIR are indexed (and re-indexed by a watcher thread when they change); a post's
+# context is prepared on first use and kept in an LRU of POST_CACHE_SIZE posts. A postId that
+# no file defines gets the generic context below instead of another post's clauses.
+DEFAULT_POST_FILE = 'post.json'
+_post_index = {}             # postId -> source file
+_post_cache = OrderedDict()  # postId -> prepared context, least recently used first
+_post_files = {}            # source file -> (mtime, postIds it defines)
+_post_lock = threading.Lock()
+GENERIC_CONTEXT_TEXT = "No draft text is available for this consultation."
+
+def normalize_context_text(text):
+    return " ".join(str(text).split())
+
+def read_post_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+def build_context_prefix(context_text):
+    """Prompt prefix shared byte-for-byte by all comments on a context"""
+    return f"Document Context: {context_text}\n"
+
+def build_comment_suffix(text, context_label):
+    """Prompt tail that completes the prefix from build_context_prefix"""
+    return f"User Comment on {context_label}: \"{text.strip()}\"\nTask: Summarize the user's main argument regarding this specific context in one sentence."
+
+def prepare_context(text, label):
+    text = normalize_context_text(text)
+    return {"text": text, "label": label, "prefix": build_context_prefix(text)}
+
+def prepare_post(post):
+    """Normalize the draft title and clause texts once and pre-build their prompt prefixes"""
+    return {
+        "postId": post['postId'],
+        "overall": prepare_context(post['title'], "Overall Policy Draft"),
+        # Quick lookup: "Q1" -> context for "Suggest specific changes..."
+        "clauses": {c['id']: prepare_context(c['text'], f"Specific Clause ({c['id']})") for c in post.get('clauses', [])}
+    }
+
+def scan_post_sources():
+    """Rebuild the postId index from all post files, re-reading new or modified ones and dropping
+    cached contexts whose source changed or disappeared; returns changed files"""
+    paths = [DEFAULT_POST_FILE] + sorted(glob.glob(os.path.join(POSTS_DIR, '*.json')))
+    files, changed = {}, [path for path in _post_files if path not in paths or not os.path.exists(path)]
+
+    for path in paths:
         try:
-            translated_text = argostranslate.translate.translate(text, "hi", "en")
-            if translated_text and translated_text.strip() != text.strip():
-                return translated_text, "Hindi"
+            mtime = os.path.getmtime(path)
+            if path in _post_files and _post_files[path][0] == mtime:
+                files[path] = _post_files[path]
+                continue
+            files[path] = (mtime, [post['postId'] for post in read_post_file(path)])
         except Exception as e:
-            print(f"Translation Error: {e}")
-        return text, "Hindi (Translation Failed)"
-            
-    return text, "English"
+            print(f"Post File Error ({path}): {e}")
+            # Keep serving what the file held before (e.g. while it is being rewritten)
+            if path in _post_files and os.path.exists(path):
+                files[path] = _post_files[path]
+            continue
+        changed.append(path)
+
+    index = {post_id: path for path, (_, ids) in files.items() for post_id in ids}
+    with _post_lock:
+        for post_id in list(_post_cache):
+            if post_id not in index or index[post_id] in changed or _post_index.get(post_id) != index[post_id]:
+                _post_cache.pop(post_id)
+        _post_index.clear()
+        _post_index.update(index)
+        _post_files.clear()
+        _post_files.update(files)
+
+    return changed
+
+def watch_post_sources():
+    """Background loop that picks up new or edited post files without a restart"""
+    while True:
+        time.sleep(POST_WATCH_INTERVAL)
+        changed = scan_post_sources()
+        if changed:
+            print(f"🔁 Post files reloaded: {changed}")
+
+def generic_post(post_id):
+    """Context for a postId no post file defines: the draft is unknown, so there are no clauses"""
+    return {**GENERIC_POST, "postId": post_id}
+
+def get_post(post_id=None):
+    """Prepared context for a postId (the default post if none is given), loaded on first use;
+    unknown postIds get the generic context"""
+    if post_id is None:
+        post_id = DEFAULT_POST_ID
+
+    with _post_lock:
+        post = _post_cache.get(post_id)
+        if post is not None:
+            _post_cache.move_to_end(post_id)
+            return post
+        path = _post_index.get(post_id)
+        if path is None:
+            return generic_post(post_id)
+
+        source = next((p for p in read_post_file(path) if p['postId'] == post_id), None)
+        if source is None:
+            return generic_post(post_id)
+        post = _post_cache[post_id] = prepare_post(source)
+        while len(_post_cache) > POST_CACHE_SIZE:
+            _post_cache.popitem(last=False)
+    return post
+
+scan_post_sources()
+DEFAULT_POST_ID = read_post_file(DEFAULT_POST_FILE)[0]['postId']
+# Shared by every unknown postId
+GENERIC_POST = {**prepare_post({"postId": None, "title": GENERIC_CONTEXT_TEXT}), "generic": True}
+
+# --- 4. METRICS ---
+# Per-stage latency histograms and failure counters, exposed in Prometheus text format on
+# /metrics. /analyze can also return the stage timings of a single request.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_HISTOGRAMS = {}  # (stage, source) -> {"buckets": [...], "sum": seconds, "count": n}
+COUNTERS = {"translation_failures_total": 0, "ollama_timeouts_total": 0}
+_metrics_lock = threading.Lock()
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def observe_stage(stage, seconds, source=""):
+    with _metrics_lock:
+        hist = STAGE_HISTOGRAMS.setdefault((stage, source), {"buckets": [0] * len(STAGE_BUCKETS), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][i] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[f"{stage}_ms"] = round(seconds * 1000, 1)
+        if source:
+            timings[f"{stage}_source"] = source
+
+def increment_counter(name, amount=1):
+    with _metrics_lock:
+        COUNTERS[name] += amount
+
+def timed_stage(stage):
+    """Decorator recording a function's latency in the stage histogram"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe_stage(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def render_metrics():
+    lines = ["# TYPE module2_stage_seconds histogram"]
+    with _metrics_lock:
+        for (stage, source), hist in sorted(STAGE_HISTOGRAMS.items()):
+            labels = f'stage="{stage}"' + (f',source="{source}"' if source else "")
+            for bound, count in zip(STAGE_BUCKETS, hist["buckets"]):
+                lines.append(f'module2_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'module2_stage_seconds_bucket{{{labels},le="+Inf"}} {hist["count"]}')
+            lines.append(f'module2_stage_seconds_sum{{{labels}}} {hist["sum"]:.6f}')
+            lines.append(f'module2_stage_seconds_count{{{labels}}} {hist["count"]}')
+        for name, value in COUNTERS.items():
+            lines.append(f"# TYPE module2_{name} counter")
+            lines.append(f"module2_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+# --- 5. CORE PROCESSING LOGIC ---
+
+def load_hi_en_translation():
+    """Resolve the installed ArgosTranslate hi->en translation object (None if not installed)"""
+    languages = argostranslate.translate.get_installed_languages()
+    hindi = next((lang for lang in languages if lang.code == "hi"), None)
+    english = next((lang for lang in languages if lang.code == "en"), None)
+    if hindi is None or english is None:
+        return None
+    return hindi.get_translation(english)
+
+def split_sentences(text):
+    """Split a comment on sentence punctuation (incl. the Devanagari danda) and line breaks"""
+    return [s.strip() for s in SENTENCE_SPLIT_RE.split(text) if s.strip()]
+
+def packaged_translator(translation):
+    """(ctranslate2 translator, tokenizer, target prefix) behind an Argos package translation, or None"""
+    pkg = getattr(translation, "pkg", None)
+    tokenizer = getattr(pkg, "tokenizer", None)
+    if tokenizer is None:
+        return None
+    # Argos creates the ctranslate2 model lazily; create it the same way and share it
+    if getattr(translation, "translator", None) is None:
+        translation.translator = ctranslate2.Translator(str(pkg.package_path / "model"), device=argostranslate.settings.device)
+    return translation.translator, tokenizer, getattr(pkg, "target_prefix", "") or ""
 
-def get_legal_summary(text, comment_type="Overall"):
+def translate_batch(sentences):
+    """Translate a batch of sentences in one model call; runs in-process or inside a forked pool worker"""
+    # Pool workers are forked before the translation is resolved, so they resolve their own
+    translation = acquire_model('translator') if 'translator' in MANAGED_MODELS else MODELS.get('translator')
+    if translation is None:
+        translation = MODELS['translator'] = load_hi_en_translation()
+
+    packaged = packaged_translator(translation)
+    if packaged is None:
+        # Pivot (composite) translations have no single model to batch on
+        return [translation.translate(s) for s in sentences]
+    translator, tokenizer, target_prefix = packaged
+    results = translator.translate_batch(
+        [tokenizer.encode(s) for s in sentences],
+        target_prefix=[[target_prefix]] * len(sentences) if target_prefix else None,
+        replace_unknowns=True, beam_size=4, length_penalty=0.2
+    )
+    translated = []
+    for result in results:
+        text = tokenizer.decode(result.hypotheses[0])
+        if target_prefix and text.startswith(target_prefix):
+            text = text[len(target_prefix):]
+        translated.append(text.strip())
+    return translated
+
+def translate_sentences(sentences):
+    """Translate sentences in batches, spreading batches over the process pool when there is one"""
+    if not MODELS.get('translation_available'):
+        raise RuntimeError("Hindi-English translation is not installed")
+
+    batches = [sentences[i:i + TRANSLATION_BATCH_SIZE] for i in range(0, len(sentences), TRANSLATION_BATCH_SIZE)]
+    pool = MODELS.get('translation_pool')
+    if pool is not None and len(batches) > 1:
+        results = pool.map(translate_batch, batches)
+    else:
+        results = run_inference(lambda: [translate_batch(b) for b in batches])
+    return [t for batch in results for t in batch]
+
+@timed_stage("detect_and_translate")
+def detect_and_translate(text):
+    """ArgosTranslate translation from Hindi to English (only Devanagari sentences are translated)"""
+    return translate_texts([text])[0]
+
+@timed_stage("detect_and_translate_batch")
+def detect_and_translate_batch(texts):
+    """detect_and_translate for many texts; their Devanagari sentences share one translate_sentences call"""
+    return translate_texts(texts)
+
+def translate_texts(texts):
+    results = [(text or "", "English") for text in texts]
+    segments = {}
+    hindi_refs = []
+    for i, text in enumerate(texts):
+        if text and DEVANAGARI_RE.search(text):
+            segments[i] = split_sentences(text)
+            hindi_refs.extend((i, j) for j, s in enumerate(segments[i]) if DEVANAGARI_RE.search(s))
+
+    if not segments:
+        return results
+
+    try:
+        translated = translate_sentences([segments[i][j] for i, j in hindi_refs])
+    except Exception as e:
+        print(f"Translation Error: {e}")
+        increment_counter("translation_failures_total", len(segments))
+        for i in segments:
+            results[i] = (texts[i], "Hindi (Translation Failed)")
+        return results
+
+    for (i, j), t in zip(hindi_refs, translated):
+        segments[i][j] = t
+    for i, sentences in segments.items():
+        translated_text = " ".join(sentences)
+        if translated_text and translated_text.strip() != texts[i].strip():
+            results[i] = (translated_text, "Hindi")
+        else:
+            increment_counter("translation_failures_total")
+            results[i] = (texts[i], "Hindi (Translation Failed)")
+    return results
+
+def choose_processing_path(text):
+    """Decide per comment whether to translate and whether an LLM summary is worth the cost"""
+    translate = bool(DEVANAGARI_RE.search(text))
+    short = len(text.split()) < SHORT_COMMENT_WORDS
+    return {
+        "name": f"{'hindi' if translate else 'english'}-{'short' if short else 'full'}",
+        "translate": translate,
+        "llm_summary": not short
+    }
+
+def extractive_summary(text):
+    """First sentence of the comment (or its first 100 chars)"""
+    sentences = text.split('.')
+    return (sentences[0].strip() + ".") if len(sentences) > 1 else (text[:100] + "..." if len(text) > 100 else text)
+
+def get_legal_summary(text, comment_type="Overall", use_llm=True, post=None):
     """Generate summary using Ollama Mistral API with context grounding"""
+    start = time.perf_counter()
+    summary, source = generate_legal_summary(text, comment_type, use_llm, post)
+    observe_stage("get_legal_summary", time.perf_counter() - start, source)
+    return summary
+
+def generate_legal_summary(text, comment_type, use_llm, post):
+    """Returns (summary, source) where source is ollama, fallback, extractive or error"""
     try:
+        if not use_llm:
+            return extractive_summary(text), "extractive"
+
         clean_id = comment_type.split(',')[0].strip() if comment_type else "Overall"
 
         # Determine context
-        if clean_id in CLAUSE_MAP:
-            context_text = CLAUSE_MAP[clean_id]
-            context_label = f"Specific Clause ({clean_id})"
-        else:
-            context_text = DRAFT_TITLE
-            context_label = "Overall Policy Draft"
-
-        # Construct prompt
-        prompt = f"Document Context: {context_text}\nUser Comment on {context_label}: \"{text.strip()}\"\nTask: Summarize the user's main argument regarding this specific context in one sentence."
+        post = post or get_post()
+        context = post["clauses"].get(clean_id, post["overall"])
+        context_label = context["label"]
 
         # Ollama API call
         if MODELS.get('ollama_available'):
             payload = {
                 "model": OLLAMA_MODEL,
-                "prompt": prompt,
+                "prompt": context["prefix"] + build_comment_suffix(text, context_label),
                 "stream": False,
-                "options": {"temperature": 0.3, "max_tokens": 100, "top_p": 0.9}
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+                "options": OLLAMA_OPTIONS
             }
             
-            response = requests.post(OLLAMA_URL, json=payload, timeout=30)
-            if response.status_code == 200:
-                return response.json().get('response', 'Summary unavailable.').strip()
+            try:
+                response = requests.post(OLLAMA_URL, json=payload, timeout=30)
+                if response.status_code == 200:
+                    return response.json().get('response', 'Summary unavailable.').strip(), "ollama"
+            except requests.Timeout:
+                print("Summarization Error: Ollama timed out, using fallback")
+                increment_counter("ollama_timeouts_total")
         
         # Fallback: extractive summary
-        sentences = text.split('.')
-        return (sentences[0].strip() + ".") if len(sentences) > 1 else (text[:100] + "..." if len(text) > 100 else text)
+        return extractive_summary(text), "fallback"
 
     except Exception as e:
         print(f"Summarization Error: {e}")
-        return "Summary unavailable."
+        return "Summary unavailable.", "error"
 
+@timed_stage("get_twitter_sentiment")
 def get_twitter_sentiment(text):
     """Get sentiment using Twitter RoBERTa"""
     try:
-        result = MODELS['sent_pipeline'](text[:512])[0]
+        result = run_inference(acquire_model('sent_pipeline'), text[:512])[0]
         return result['label'].capitalize(), round(result['score'], 4)
     except Exception as e:
         print(f"Sentiment Error: {e}")
         return "Neutral", 0.0
 
-# --- 4. FLASK APP ---
+@timed_stage("get_twitter_sentiment_batch")
+def get_twitter_sentiment_batch(texts):
+    """Sentiment for many texts in one pipeline call"""
+    try:
+        results = run_inference(acquire_model('sent_pipeline'), [t[:512] for t in texts], batch_size=len(texts))
+        return [(r['label'].capitalize(), round(r['score'], 4)) for r in results]
+    except Exception as e:
+        print(f"Sentiment Error: {e}")
+        return [("Neutral", 0.0) for _ in texts]
+
+def build_result(post, raw_comment, final_english_text, detected_lang, sentiment, score, summary, path):
+    return {
+        "postId": post["postId"],
+        "post_context": "generic" if post.get("generic") else "draft",
+        "original_text": raw_comment,
+        "analyzed_text": final_english_text,
+        "detected_language": detected_lang,
+        "sentiment": sentiment,
+        "sentiment_score": score,
+        "ai_summary": summary,
+        "processing_path": path["name"]
+    }
+
+def run_analysis(raw_comment, comment_type="Overall", post_id=None):
+    """Full per-comment analysis shared by /analyze and the job workers"""
+    post = get_post(post_id)
+    # English skips the translator, short comments skip Ollama
+    path = choose_processing_path(raw_comment)
+    if path["translate"]:
+        final_english_text, detected_lang = detect_and_translate(raw_comment)
+    else:
+        final_english_text, detected_lang = raw_comment, "English"
+    sentiment, score = get_twitter_sentiment(final_english_text)
+    summary = get_legal_summary(final_english_text, comment_type, use_llm=path["llm_summary"], post=post)
+
+    return build_result(post, raw_comment, final_english_text, detected_lang, sentiment, score, summary, path)
+
+# --- 6. ASYNC ANALYSIS JOBS ---
+# Jobs are persisted in SQLite so queued work survives a restart, and run on a
+# bounded thread pool; JOB_QUEUE_LIMIT caps how many can be queued or running.
+_job_db = sqlite3.connect(JOB_DB_PATH, check_same_thread=False)
+_job_db_lock = threading.Lock()
+_job_slots = threading.BoundedSemaphore(JOB_QUEUE_LIMIT)
+_job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="analysis-job")
+
+with _job_db_lock:
+    _job_db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )""")
+    _job_db.execute("CREATE INDEX IF NOT EXISTS jobs_status_updated_at ON jobs (status, updated_at)")
+    _job_db.commit()
+
+FINISHED_JOB_STATUSES = ("completed", "failed", "rejected")
+
+def create_job(payload):
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    with _job_db_lock:
+        _job_db.execute(
+            "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(payload), now, now)
+        )
+        _job_db.commit()
+    return job_id
+
+def update_job(job_id, status, result=None, error=None):
+    with _job_db_lock:
+        _job_db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+        )
+        if status in FINISHED_JOB_STATUSES:
+            # Keep only the newest JOB_HISTORY finished jobs so jobs.db stays bounded
+            _job_db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?, ?) AND id NOT IN "
+                "(SELECT id FROM jobs WHERE status IN (?, ?, ?) ORDER BY updated_at DESC LIMIT ?)",
+                FINISHED_JOB_STATUSES + FINISHED_JOB_STATUSES + (JOB_HISTORY,)
+            )
+        _job_db.commit()
+
+def get_job(job_id):
+    with _job_db_lock:
+        row = _job_db.execute(
+            "SELECT id, status, result, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {
+        "jobId": row[0],
+        "status": row[1],
+        "result": json.loads(row[2]) if row[2] else None,
+        "error": row[3],
+        "created_at": row[4],
+        "updated_at": row[5]
+    }
+
+def notify_webhook(url, job):
+    try:
+        requests.post(url, json=job, timeout=10)
+    except Exception as e:
+        print(f"Webhook Error ({url}): {e}")
+
+def run_job(job_id, payload):
+    try:
+        update_job(job_id, "running")
+        result = run_analysis(payload["comment"], payload.get("commentType", "Overall"), payload.get("postId"))
+        update_job(job_id, "completed", result=result)
+    except Exception as e:
+        print(f"Job Error ({job_id}): {e}")
+        update_job(job_id, "failed", error=str(e))
+    finally:
+        _job_slots.release()
+
+    if payload.get("webhookUrl"):
+        notify_webhook(payload["webhookUrl"], get_job(job_id))
+
+def submit_job(job_id, payload):
+    """Queue a job on the worker pool; False when the queue is full"""
+    if not _job_slots.acquire(blocking=False):
+        return False
+    _job_executor.submit(run_job, job_id, payload)
+    return True
+
+def resume_pending_jobs():
+    """Re-queue jobs that were queued or running when the process last stopped"""
+    with _job_db_lock:
+        rows = _job_db.execute("SELECT id, payload FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at").fetchall()
+    resumed = 0
+    for job_id, payload in rows:
+        if not submit_job(job_id, json.loads(payload)):
+            break
+        resumed += 1
+    return resumed
+
+# --- 7. BULK NDJSON ANALYSIS ---
+# Backfills stream NDJSON in and out. Comments are read in batches of BULK_BATCH_SIZE, translated
+# and scored per batch, then summarized on a thread pool while the next batch is read; results
+# are written as they finish (tagged with their index) and at most BULK_MAX_IN_FLIGHT comments
+# are held at once.
+def bulk_item_error(item):
+    """Why a parsed bulk line cannot be analyzed, or None"""
+    if not isinstance(item.get("comment") or "", str):
+        return "comment must be a string"
+    if not isinstance(item.get("commentType") or "", str):
+        return "commentType must be a string"
+    post_id = item.get("postId")
+    if post_id is not None and (isinstance(post_id, bool) or not isinstance(post_id, (str, int))):
+        return "postId must be a string or number"
+    if not (item.get("comment") or "").strip():
+        return "Empty comment"
+    return None
+
+def read_bulk_batches(lines):
+    """Parse NDJSON lines into batches of (index, item, error)"""
+    batch = []
+    for line_no, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            batch.append((line_no, None, f"Invalid JSON line: {e}"))
+        else:
+            if not isinstance(item, dict):
+                batch.append((line_no, None, "Each line must be a JSON object"))
+            else:
+                error = bulk_item_error(item)
+                batch.append((item.get("index", line_no), None if error else item, error))
+        if len(batch) >= BULK_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def prepare_bulk_batch(batch):
+    """Translate and score a batch; returns (index, pending analysis) pairs and error lines"""
+    valid = [(index, item) for index, item, error in batch if error is None]
+    errors = [{"index": index, "success": False, "error": error} for index, _, error in batch if error is not None]
+    if not valid:
+        return [], errors
+
+    try:
+        comments = [item["comment"].strip() for _, item in valid]
+        paths = [choose_processing_path(c) for c in comments]
+        translations = detect_and_translate_batch([c if p["translate"] else "" for c, p in zip(comments, paths)])
+        english = [t[0] if p["translate"] else c for c, p, t in zip(comments, paths, translations)]
+        languages = [t[1] if p["translate"] else "English" for p, t in zip(paths, translations)]
+        sentiments = get_twitter_sentiment_batch(english)
+    except Exception as e:
+        # One error line per comment instead of ending the response stream
+        print(f"Bulk Batch Error: {e}")
+        return [], errors + [{"index": index, "success": False, "error": str(e)} for index, _ in valid]
+
+    pending = []
+    for (index, item), comment, path, text, lang, (sentiment, score) in zip(valid, comments, paths, english, languages, sentiments):
+        try:
+            post = get_post(item.get("postId"))
+        except Exception as e:
+            errors.append({"index": index, "success": False, "error": str(e)})
+            continue
+        pending.append((index, {
+            "post": post,
+            "comment_type": item.get("commentType", "Overall"),
+            "raw_comment": comment,
+            "text": text,
+            "lang": lang,
+            "sentiment": sentiment,
+            "score": score,
+            "path": path
+        }))
+    return pending, errors
+
+def finish_bulk_item(index, work):
+    """Summary stage of the bulk pipeline (runs on the summary pool)"""
+    try:
+        summary = get_legal_summary(work["text"], work["comment_type"], use_llm=work["path"]["llm_summary"], post=work["post"])
+        result = build_result(work["post"], work["raw_comment"], work["text"], work["lang"],
+                              work["sentiment"], work["score"], summary, work["path"])
+        return {"index": index, "success": True, **result}
+    except Exception as e:
+        return {"index": index, "success": False, "error": str(e)}
+
+def stream_bulk_analysis(lines):
+    """Yield NDJSON result lines as each comment finishes"""
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=BULK_SUMMARY_WORKERS, thread_name_prefix="bulk-summary") as summary_pool:
+        for batch in read_bulk_batches(lines):
+            pending, errors = prepare_bulk_batch(batch)
+            for line in errors:
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            for index, work in pending:
+                in_flight.add(summary_pool.submit(finish_bulk_item, index, work))
+
+            # Write back what is done; block only when too many comments are held
+            while in_flight:
+                done, in_flight = wait(in_flight, timeout=0 if len(in_flight) < BULK_MAX_IN_FLIGHT else None,
+                                       return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    yield json.dumps(future.result(), ensure_ascii=False) + "\n"
+
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield json.dumps(future.result(), ensure_ascii=False) + "\n"
+
+# --- 8. FLASK APP ---
 
 app = Flask(__name__)
 
-# Load models on startup
-with app.app_context():
+def start_service():
     load_models()
+    if OLLAMA_PROBE_INTERVAL > 0:
+        threading.Thread(target=watch_ollama, name="ollama-probe", daemon=True).start()
+    if MODEL_IDLE_TTL > 0 or MEMORY_BUDGET_MB > 0:
+        threading.Thread(target=watch_model_memory, name="model-reaper", daemon=True).start()
+    resumed = resume_pending_jobs()
+    if resumed:
+        print(f"🔁 Resumed {resumed} pending analysis jobs")
+
+NOT_READY = ({"success": False, "error": "Models are still loading"}, 503)
+
+# Load models on startup (in the background in offline mode, see /ready)
+with app.app_context():
+    # The translation pool forks, so it has to exist before any thread is started
+    timed_phase("translation_pool", start_translation_pool)
+    if POST_WATCH_INTERVAL > 0:
+        threading.Thread(target=watch_post_sources, name="post-watcher", daemon=True).start()
+    if OFFLINE_STARTUP:
+        threading.Thread(target=start_service, name="startup", daemon=True).start()
+    else:
+        start_service()
 
 @app.route("/analyze", methods=["POST"])
 def analyze_comment():
+    if not STARTUP['ready']:
+        return NOT_READY
     try:
         data = request.get_json()
         raw_comment = data.get("comment", "").strip()
         comment_type = data.get("commentType", "Overall")
+        post_id = data.get("postId")
+        want_timings = bool(data.get("timings")) or request.args.get("timings") == "true"
         
         if not raw_comment:
             return jsonify({"success": False, "error": "Empty comment"}), 400
 
-        # Process comment
-        final_english_text, detected_lang = detect_and_translate(raw_comment)
-        sentiment, score = get_twitter_sentiment(final_english_text)
-        summary = get_legal_summary(final_english_text, comment_type)
-
-        return jsonify({
-            "success": True,
-            "original_text": raw_comment,
-            "analyzed_text": final_english_text,
-            "detected_language": detected_lang,
-            "sentiment": sentiment,
-            "sentiment_score": score,
-            "ai_summary": summary
-        })
+        # Process comment (optionally collecting per-stage timings)
+        timings = {} if want_timings else None
+        token = _request_timings.set(timings)
+        try:
+            start = time.perf_counter()
+            result = run_analysis(raw_comment, comment_type, post_id)
+            if timings is not None:
+                timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                result["timings"] = timings
+        finally:
+            _request_timings.reset(token)
+        return jsonify({"success": True, **result})
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/analyze/bulk", methods=["POST"])
+def analyze_bulk():
+    """NDJSON in (one {"comment", "commentType", "postId", "index"} per line), NDJSON out"""
+    if not STARTUP['ready']:
+        return NOT_READY
+    lines = iter(lambda: request.stream.readline().decode('utf-8'), '')
+    return Response(stream_with_context(stream_bulk_analysis(lines)), mimetype="application/x-ndjson")
+
+@app.route("/jobs", methods=["POST"])
+def submit_analysis_job():
+    if not STARTUP['ready']:
+        return NOT_READY
+    try:
+        data = request.get_json() or {}
+        raw_comment = data.get("comment", "").strip()
+        if not raw_comment:
+            return jsonify({"success": False, "error": "Empty comment"}), 400
+
+        payload = {
+            "comment": raw_comment,
+            "commentType": data.get("commentType", "Overall"),
+            "postId": data.get("postId"),
+            "webhookUrl": data.get("webhookUrl")
+        }
+        job_id = create_job(payload)
+        if not submit_job(job_id, payload):
+            update_job(job_id, "rejected", error="Job queue is full")
+            return jsonify({"success": False, "error": "Job queue is full"}), 429
+
+        return jsonify({"success": True, "jobId": job_id, "status": "queued"}), 202
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_analysis_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, **job})
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    body = {"ready": STARTUP['ready'], "error": STARTUP['error'], "startup_mode": STARTUP_MODE}
+    return body, 200 if STARTUP['ready'] else 503
+
 @app.route("/status", methods=["GET"])
 def status():
     return {
         "status": "active",
+        "ready": STARTUP['ready'],
+        "startup_mode": STARTUP_MODE,
+        "startup": STARTUP,
         "model_translation": "argostranslate (hi->en)",
+        "translation_workers": MODELS.get('translation_workers', 0),
+        "inference_workers": INFERENCE_WORKERS,
+        "torch_threads": MODELS.get('torch_threads'),
         "model_summary": f"ollama:{OLLAMA_MODEL}" if MODELS.get('ollama_available') else "fallback",
         "model_sentiment": ID_SENT,
-        "ollama_available": MODELS.get('ollama_available', False)
+        "sentiment_backend": MODELS.get('sentiment_backend', SENTIMENT_BACKEND),
+        "sentiment_parity": MODELS.get('sentiment_parity'),
+        "model_memory": model_memory_report(),
+        "ollama_available": MODELS.get('ollama_available', False),
+        "ollama_checked_at": MODELS.get('ollama_checked_at'),
+        "known_posts": len(_post_index),
+        "loaded_posts": len(_post_cache),
+        "job_workers": JOB_WORKERS
     }
 
 if __name__ == "__main__":
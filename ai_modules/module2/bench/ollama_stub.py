@@ -0,0 +1,106 @@
+"""Local stand-in for the Ollama HTTP API used by module2 (/api/generate and /api/tags).
+
+Latency is modelled as a fixed per-call cost plus a cost per prompt token that is not a
+prefix of a recently evaluated prompt (a small KV cache, like Ollama's with keep_alive), plus
+any tokens supplied through `context`. Like Ollama, raw requests get no `context` back.
+
+    python bench/ollama_stub.py --port 11434 --base-latency 0.2 --token-latency 0.002
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONFIG = {"base_latency": 0.2, "token_latency": 0.002, "jitter": 0.0, "model": "mistral:7b-instruct", "kv_slots": 4}
+_kv_cache = []  # recently evaluated prompts (token lists), most recent last
+_kv_lock = threading.Lock()
+
+
+def uncached_tokens(tokens):
+    """Prompt tokens past the longest prefix shared with a cached prompt; caches this prompt"""
+    with _kv_lock:
+        shared = 0
+        for cached in _kv_cache:
+            n = 0
+            for a, b in zip(cached, tokens):
+                if a != b:
+                    break
+                n += 1
+            shared = max(shared, n)
+        _kv_cache.append(tokens)
+        del _kv_cache[:-CONFIG["kv_slots"]]
+    return len(tokens) - shared
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": CONFIG["model"], "model": CONFIG["model"]}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        prompt_tokens = payload.get("prompt", "").split()
+        context = payload.get("context") or []
+        num_predict = (payload.get("options") or {}).get("num_predict", 20)
+
+        delay = CONFIG["base_latency"] + CONFIG["token_latency"] * (uncached_tokens(prompt_tokens) + len(context))
+        delay += random.uniform(0, CONFIG["jitter"])
+        time.sleep(delay)
+
+        generated = ["stub"] * max(1, min(num_predict, 20))
+        body = {
+            "model": payload.get("model", CONFIG["model"]),
+            "response": "The commenter's main argument is summarized here.",
+            "done": True,
+            "prompt_eval_count": len(prompt_tokens),
+            "eval_count": len(generated),
+        }
+        if not payload.get("raw"):
+            body["context"] = list(context) + list(range(len(prompt_tokens))) + list(range(len(generated)))
+        self._send_json(200, body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port=0, **config):
+    """Start the stub on a background thread; returns (server, base_url)"""
+    CONFIG.update({k: v for k, v in config.items() if v is not None})
+    server = ThreadingHTTPServer(("127.0.0.1", port), OllamaStubHandler)
+    threading.Thread(target=server.serve_forever, name="ollama-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Ollama stand-in for module2")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--base-latency", type=float, default=0.2, help="seconds per call")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="seconds per uncached prompt token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="max extra random seconds per call")
+    parser.add_argument("--kv-slots", type=int, default=4, help="recent prompts whose prefixes are cached")
+    args = parser.parse_args()
+
+    server, url = start_stub(args.port, base_latency=args.base_latency, token_latency=args.token_latency, jitter=args.jitter, kv_slots=args.kv_slots)
+    print(f"Ollama stub listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
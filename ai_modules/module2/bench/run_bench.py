@@ -0,0 +1,173 @@
+"""Offline benchmark for module2 /analyze and /analyze/bulk.
+
+Runs module2 in-process against the local Ollama stub (bench/ollama_stub.py) with the sentiment
+and argos models loaded from the local cache only, then writes machine-readable results:
+
+    python bench/run_bench.py --iterations 3 --batch-repeat 20 --output bench/results/latest.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from ollama_stub import start_stub
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * pct / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def latency_stats(seconds):
+    return {
+        "count": len(seconds),
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 2) if seconds else None,
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2) if seconds else None,
+        "p95_ms": round(percentile(seconds, 95) * 1000, 2) if seconds else None,
+        "p99_ms": round(percentile(seconds, 99) * 1000, 2) if seconds else None,
+    }
+
+
+def rss_mb():
+    """Current and peak resident set size in MB"""
+    current = peak = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"rss_mb": round(current, 1) if current else None, "peak_rss_mb": round(peak, 1) if peak else None}
+
+
+def bench_single(client, corpus, iterations):
+    """Sequential /analyze calls; latency overall and per language / processing path"""
+    overall, by_language, by_path = [], {}, {}
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for item in corpus:
+            t0 = time.perf_counter()
+            resp = client.post("/analyze", json={"comment": item["comment"], "timings": True})
+            elapsed = time.perf_counter() - t0
+            body = resp.get_json()
+            if resp.status_code != 200 or not body.get("success"):
+                raise RuntimeError(f"/analyze failed: {body}")
+            overall.append(elapsed)
+            by_language.setdefault(item["language"], []).append(elapsed)
+            by_path.setdefault(body.get("processing_path", "unknown"), []).append(elapsed)
+    wall = time.perf_counter() - start
+
+    return {
+        **latency_stats(overall),
+        "throughput_per_s": round(len(overall) / wall, 2),
+        "by_language": {k: latency_stats(v) for k, v in by_language.items()},
+        "by_path": {k: latency_stats(v) for k, v in by_path.items()},
+    }
+
+
+def bench_batch(client, corpus, repeat):
+    """One /analyze/bulk request over the corpus repeated `repeat` times"""
+    lines = [json.dumps({"index": i, "comment": item["comment"]}, ensure_ascii=False)
+             for i, item in enumerate(corpus * repeat)]
+    start = time.perf_counter()
+    resp = client.post("/analyze/bulk", data="\n".join(lines).encode("utf-8"), content_type="application/x-ndjson")
+    results = [json.loads(line) for line in resp.get_data(as_text=True).splitlines() if line.strip()]
+    wall = time.perf_counter() - start
+
+    failed = sum(1 for r in results if not r.get("success"))
+    return {
+        "comments": len(lines),
+        "results": len(results),
+        "failed": failed,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(results) / wall, 2) if wall else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline module2 benchmark")
+    parser.add_argument("--iterations", type=int, default=3, help="passes over the corpus for single-comment latency")
+    parser.add_argument("--batch-repeat", type=int, default=20, help="corpus copies sent in the bulk request")
+    parser.add_argument("--ollama-latency", type=float, default=0.2, help="stub seconds per Ollama call")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="stub seconds per uncached prompt token")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "corpus.json"))
+    parser.add_argument("--output", default=None, help="results JSON path (default bench/results/bench-<timestamp>.json)")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    stub, stub_url = start_stub(base_latency=args.ollama_latency, token_latency=args.token_latency)
+    os.environ.update({
+        "OLLAMA_URL": f"{stub_url}/api/generate",
+        "MODELS_LOCAL_ONLY": "true",
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1",
+        "POST_WATCH_INTERVAL": "0",
+        "JOB_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="module2-bench-"), "jobs.db"),
+    })
+
+    # module2 reads post.json and friends relative to its own directory
+    os.chdir(MODULE_DIR)
+    sys.path.insert(0, MODULE_DIR)
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    import app as module2
+    startup_s = time.perf_counter() - t0
+    rss_loaded = rss_mb()
+
+    client = module2.app.test_client()
+    client.post("/analyze", json={"comment": corpus[0]["comment"]})  # warm-up
+
+    single = bench_single(client, corpus, args.iterations)
+    batch = bench_batch(client, corpus, args.batch_repeat)
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "iterations": args.iterations,
+            "batch_repeat": args.batch_repeat,
+            "corpus_size": len(corpus),
+            "ollama_latency_s": args.ollama_latency,
+            "token_latency_s": args.token_latency,
+            "cpu_count": os.cpu_count(),
+        },
+        "startup_s": round(startup_s, 3),
+        "memory": {"before_import": rss_before, "after_load": rss_loaded, "after_run": rss_mb()},
+        "single": single,
+        "batch": batch,
+        "status": client.get("/status").get_json(),
+    }
+
+    output = args.output or os.path.join(BENCH_DIR, "results", f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print(f"single: p50={single['p50_ms']}ms p95={single['p95_ms']}ms p99={single['p99_ms']}ms "
+          f"({single['throughput_per_s']}/s)")
+    print(f"batch:  {batch['results']} comments in {batch['wall_s']}s ({batch['throughput_per_s']}/s)")
+    print(f"peak RSS: {results['memory']['after_run']['peak_rss_mb']} MB")
+    print(f"results written to {output}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
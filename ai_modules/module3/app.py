@@ -1,20 +1,24 @@
-import os, time, math, asyncio, numpy as np, pandas as pd, requests
+import os, time, math, json, uuid, asyncio, hashlib, sqlite3, threading, numpy as np, requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import vertexai
 from google.oauth2 import service_account
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import nest_asyncio
-from sklearn.cluster import KMeans, MiniBatchKMeans
-from sklearn.metrics import silhouette_score
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
-from sklearn.neighbors import NearestNeighbors
-from sklearn.metrics.pairwise import cosine_similarity
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_google_vertexai import ChatVertexAI, HarmBlockThreshold, HarmCategory
 from vertexai.preview.language_models import TextEmbeddingModel
 from dotenv import load_dotenv
+from dedupe import semantic_dedupe_fast, exact_duplicate_groups, exact_duplicate_key
+from clustering import sweep_k, fit_kmeans_sharded, predict_sharded
+from corpus_store import ShardedCorpus
+from reduction import REDUCE_METHOD, REDUCE_DIM, REDUCE_QUALITY_SAMPLE, reducer_config, fit_reducer, apply_reducer, reduction_quality
+from cluster_state import INCREMENTAL_CLUSTERING, load_cluster_state, write_cluster_state, build_cluster_state, assign_incremental
 
 app = Flask(__name__)
 CORS(app)
@@ -25,6 +29,7 @@ nest_asyncio.apply()
 API_URL = os.environ.get("API_URL")
 if not API_URL:
     raise ValueError("API_URL not set in environment variables")
+LLM_MODEL_NAME = "gemini-2.5-flash-lite"
 try:
 
     PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
@@ -45,7 +50,7 @@ try:
     }
 
     llm = ChatVertexAI(
-        model="gemini-2.5-flash-lite",
+        model=LLM_MODEL_NAME,
         temperature=0.2,
         max_output_tokens=4096,
         project=PROJECT_ID,
@@ -59,12 +64,78 @@ except Exception as e:
 
 pipeline = llm | StrOutputParser()
 
-embed_model = TextEmbeddingModel.from_pretrained("text-embedding-004")
+EMBED_MODEL_NAME = "text-embedding-004"
+# REDUCE_METHOD=output_dim asks the model itself for REDUCE_DIM-dim vectors (see reduction.py)
+EMBED_OUTPUT_DIM = REDUCE_DIM if REDUCE_METHOD == "output_dim" else None
+# Only pass output_dimensionality when it is set; older SDKs reject the keyword
+EMBED_KWARGS = {"output_dimensionality": EMBED_OUTPUT_DIM} if EMBED_OUTPUT_DIM else {}
+# Embedding backend: "vertex" or "fake" (deterministic local vectors with FAKE_EMBED_LATENCY
+# seconds per request, for offline runs and load tests)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "vertex").lower()
+FAKE_EMBED_LATENCY = float(os.getenv("FAKE_EMBED_LATENCY", 0.5))
+# Embedding stage: concurrent requests, request rate limit (per second, 0 = unlimited) and the
+# per-request latency that adaptive batch sizing aims for
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 15))
+EMBED_RATE_LIMIT = float(os.getenv("EMBED_RATE_LIMIT", 10))
+EMBED_TARGET_LATENCY = float(os.getenv("EMBED_TARGET_LATENCY", 2.0))
+EMBED_MIN_BATCH, EMBED_MAX_BATCH = 16, 250
+# Failed embedding requests are retried with exponential backoff; batches rejected for their
+# input are bisected instead. After EMBED_MAX_FAILED_CALLS backend failures (transport, quota,
+# auth, 5xx) in one run the rest of the run fails fast instead of hammering a backend that is down.
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 3))
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", 1.0))
+EMBED_MAX_FAILED_CALLS = int(os.getenv("EMBED_MAX_FAILED_CALLS", 20))
+EMBED_INPUT_ERROR_CODES = (400, 413, 422)
 
 
+class FakeEmbeddingModel:
+    """Stand-in for TextEmbeddingModel: hash-seeded 768-dim vectors after a fixed delay"""
+    class _Embedding:
+        def __init__(self, values):
+            self.values = values
+
+    def __init__(self, latency, dim=768):
+        self.latency = latency
+        self.dim = dim
+
+    def get_embeddings(self, texts, output_dimensionality=None):
+        time.sleep(self.latency)
+        out = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            out.append(self._Embedding(np.random.default_rng(seed).standard_normal(output_dimensionality or self.dim).tolist()))
+        return out
+
+
+if EMBED_BACKEND == "fake":
+    embed_model = FakeEmbeddingModel(FAKE_EMBED_LATENCY)
+else:
+    embed_model = TextEmbeddingModel.from_pretrained(EMBED_MODEL_NAME)
+
+# Blocking embedding calls run here so the event loop keeps every request in flight
+_embed_executor = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed")
+
+# Persistent embedding cache (SQLite, float16 blobs) keyed by model + comment text hash; the
+# oldest rows beyond EMBED_CACHE_MAX_ROWS are dropped (0 = unbounded)
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.db")
+EMBED_CACHE_MAX_ROWS = int(os.getenv("EMBED_CACHE_MAX_ROWS", 500000))
+# Cached cluster summaries live in the same DB; the oldest beyond SUMMARY_CACHE_MAX_ROWS are dropped
+SUMMARY_CACHE_MAX_ROWS = int(os.getenv("SUMMARY_CACHE_MAX_ROWS", 20000))
+# Seconds between cache prunes (expired and over-cap rows)
+CACHE_PRUNE_INTERVAL = float(os.getenv("CACHE_PRUNE_INTERVAL", 300))
+
+# Truncate very long comments to avoid API issues (also part of the embedding cache key)
+MAX_COMMENT_LENGTH = 5000
+
+# Comment ingestion: page size for the backend's cursor pagination (0 = one unpaged request)
+COMMENTS_PAGE_SIZE = int(os.getenv("COMMENTS_PAGE_SIZE", 1000))
+
+
+# No cluster id in the prompt: summaries are cached by cluster text, and ids change between runs
+# (the synthesis prompt labels each summary with its cluster)
 cluster_prompt = PromptTemplate(
-    input_variables=["cluster_id", "text"],
-    template="""You are a legal analyst. Summarize the following public comments for cluster {cluster_id}.
+    input_variables=["text"],
+    template="""You are a legal analyst. Summarize the following public comments from one cluster.
 {text}
 Provide:
 - Dominant themes (bulleted)
@@ -165,38 +236,304 @@ Produce:
 # ============================================================
 # OPTIMIZED ASYNC HELPERS
 # ============================================================
-async def get_embeddings_async(texts, batch_size=250, concurrency=15):
-    """Optimized embedding generation with smaller batches and higher concurrency"""
-    sem = asyncio.Semaphore(concurrency)
-    embeddings = []
-    
-    async def embed_batch(batch):
-        async with sem:
-            try:
-                await asyncio.sleep(0.1)  
-                resp = embed_model.get_embeddings(batch)
-                return [r.values for r in resp]
-            except Exception as e:
-                print(f"⚠️ Embedding batch failed: {e}")
-                
-                return [[0.0] * 768 for _ in batch]
-    
-    def batched(iterable, batch_size=batch_size):
-        for i in range(0, len(iterable), batch_size):
-            yield iterable[i:i+batch_size]
-    
-    batches = list(batched(texts, batch_size))
-    print(f"   Processing {len(batches)} embedding batches...")
-    
-    results = await asyncio.gather(*[embed_batch(b) for b in batches], return_exceptions=True)
-    
-    for r in results:
-        if isinstance(r, Exception):
-            print(f"⚠️ Batch error: {r}")
-            continue
-        embeddings.extend(r)
+class TokenBucket:
+    """Async token bucket: at most `rate` acquisitions per second, bursts up to `capacity`"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def is_input_error(e):
+    """True when the request was rejected for its content, so bisecting can isolate the bad input"""
+    return getattr(e, "code", None) in EMBED_INPUT_ERROR_CODES
+
+async def embed_batch_with_retry(batch, limiter, report, retries=EMBED_MAX_RETRIES):
+    """Embed a batch with exponential-backoff retries. A batch rejected for its input is bisected
+    right away (retrying the same input cannot help) to isolate bad inputs, which come back as
+    None. Other errors (transport, 5xx, quota) fail the whole batch once its retries are used up;
+    they count toward the run's failed-call budget, and once that is spent every remaining
+    batch fails without a call."""
+    loop = asyncio.get_running_loop()
+    last_error = None
+    for attempt in range(retries):
+        if report["circuit_open"]:
+            report["failed"] += len(batch)
+            return [None] * len(batch)
+        if attempt > 0:
+            report["retried"] += len(batch)
+            await asyncio.sleep(EMBED_RETRY_BACKOFF * 2 ** (attempt - 1))
+        await limiter.acquire()
+        try:
+            resp = await loop.run_in_executor(
+                _embed_executor, lambda: embed_model.get_embeddings(batch, **EMBED_KWARGS)
+            )
+            return [r.values for r in resp]
+        except Exception as e:
+            last_error = e
+            if is_input_error(e):
+                break
+            report["failed_calls"] += 1
+            if report["failed_calls"] >= EMBED_MAX_FAILED_CALLS and not report["circuit_open"]:
+                report["circuit_open"] = True
+                print(f"⚠️ Embedding stopped after {report['failed_calls']} failed calls: {str(e)[:200]}")
+
+    if len(batch) == 1 or not is_input_error(last_error):
+        print(f"⚠️ Embedding failed for {len(batch)} comment(s): {str(last_error)[:200]}")
+        report["failed"] += len(batch)
+        return [None] * len(batch)
+
+    mid = len(batch) // 2
+    report["bisected"] += 1
+    left, right = await asyncio.gather(
+        embed_batch_with_retry(batch[:mid], limiter, report, retries),
+        embed_batch_with_retry(batch[mid:], limiter, report, retries)
+    )
+    return left + right
+
+def new_embed_report():
+    """Per-run embedding counters; sharing one across calls shares the failed-call budget"""
+    return {"retried": 0, "failed": 0, "bisected": 0, "failed_calls": 0, "circuit_open": False}
+
+async def get_embeddings_async(texts, batch_size=250, concurrency=EMBED_CONCURRENCY, report=None):
+    """Concurrent embedding pipeline: `concurrency` workers pull batches, run the blocking model
+    call on the embed executor under a token-bucket rate limit, and resize batches so each
+    request stays near EMBED_TARGET_LATENCY. Results stay index-aligned with `texts`; inputs
+    that could not be embedded are None. Returns (embeddings, report)."""
+    n = len(texts)
+    report = new_embed_report() if report is None else report
+    if n == 0:
+        return [], report
+
+    limiter = TokenBucket(EMBED_RATE_LIMIT, capacity=concurrency)
+    embeddings = [None] * n
+    # Start small enough that every worker gets a batch
+    state = {"next": 0, "size": max(EMBED_MIN_BATCH, min(batch_size, EMBED_MAX_BATCH, math.ceil(n / concurrency)))}
+
+    async def worker():
+        while state["next"] < n:
+            start, size = state["next"], state["size"]
+            state["next"] = start + size
+            batch = texts[start:start+size]
+
+            t0 = time.monotonic()
+            vectors = await embed_batch_with_retry(batch, limiter, report)
+            latency = time.monotonic() - t0
+
+            # Adapt batch size to response latency
+            if latency < EMBED_TARGET_LATENCY / 2:
+                state["size"] = min(EMBED_MAX_BATCH, int(state["size"] * 1.5))
+            elif latency > EMBED_TARGET_LATENCY:
+                state["size"] = max(EMBED_MIN_BATCH, state["size"] // 2)
+
+            embeddings[start:start+len(batch)] = vectors
+
+    print(f"   Embedding {n} texts with {concurrency} concurrent workers...")
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    if report["retried"] or report["failed"]:
+        print(f"   ⚠️ Embedding report: {report}")
+    return embeddings, report
+
+# ============================================================
+# EMBEDDING CACHE
+# ============================================================
+_embed_cache_db = sqlite3.connect(EMBED_CACHE_PATH, check_same_thread=False)
+_embed_cache_lock = threading.Lock()
+with _embed_cache_lock:
+    _embed_cache_db.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL DEFAULT 0)"
+    )
+    _embed_cache_db.execute(
+        "CREATE TABLE IF NOT EXISTS cluster_summaries (key TEXT PRIMARY KEY, summary TEXT NOT NULL, created_at REAL NOT NULL DEFAULT 0)"
+    )
+    # Caches created before rows were timestamped; their rows count as the oldest
+    for table in ("embeddings", "cluster_summaries"):
+        if "created_at" not in [row[1] for row in _embed_cache_db.execute(f"PRAGMA table_info({table})")]:
+            _embed_cache_db.execute(f"ALTER TABLE {table} ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+        _embed_cache_db.execute(f"CREATE INDEX IF NOT EXISTS {table}_created_at ON {table} (created_at)")
+    _embed_cache_db.execute("CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, report TEXT NOT NULL, created_at REAL NOT NULL)")
+    _embed_cache_db.execute("CREATE INDEX IF NOT EXISTS reports_created_at ON reports (created_at)")
+    _embed_cache_db.commit()
+_last_prune = {}
+
+def prune_cache_table(table, max_rows, ttl=0):
+    """Drop rows older than ttl seconds and the oldest beyond max_rows (0 disables either), at most
+    once per CACHE_PRUNE_INTERVAL per table. Call with _embed_cache_lock held"""
+    now = time.time()
+    if now - _last_prune.get(table, 0) < CACHE_PRUNE_INTERVAL:
+        return
+    _last_prune[table] = now
+    if ttl > 0:
+        _embed_cache_db.execute(f"DELETE FROM {table} WHERE created_at < ?", (now - ttl,))
+    if max_rows > 0:
+        _embed_cache_db.execute(
+            f"DELETE FROM {table} WHERE key IN (SELECT key FROM {table} ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (max_rows,)
+        )
+
+def embedding_cache_key(text):
+    model = f"{EMBED_MODEL_NAME}@{EMBED_OUTPUT_DIM}" if EMBED_OUTPUT_DIM else EMBED_MODEL_NAME
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+def embedding_cache_get(keys, chunk=500):
+    """Return {key: float32 vector} for the keys present in the cache"""
+    found = {}
+    with _embed_cache_lock:
+        for i in range(0, len(keys), chunk):
+            part = keys[i:i+chunk]
+            rows = _embed_cache_db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    return found
+
+def embedding_cache_put(items):
+    """Store (key, vector) pairs as float16"""
+    now = time.time()
+    with _embed_cache_lock:
+        _embed_cache_db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+            [(key, np.asarray(vec, dtype=np.float16).tobytes(), now) for key, vec in items]
+        )
+        prune_cache_table("embeddings", EMBED_CACHE_MAX_ROWS)
+        _embed_cache_db.commit()
+
+def summary_cache_key(text):
+    """Cluster summaries depend on the final cluster text, the prompt and the LLM"""
+    return hashlib.sha256(f"{LLM_MODEL_NAME}\x00{cluster_prompt.template}\x00{text}".encode("utf-8")).hexdigest()
+
+def summary_cache_get(key):
+    with _embed_cache_lock:
+        row = _embed_cache_db.execute("SELECT summary FROM cluster_summaries WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def summary_cache_put(key, summary):
+    with _embed_cache_lock:
+        _embed_cache_db.execute(
+            "INSERT OR REPLACE INTO cluster_summaries (key, summary, created_at) VALUES (?, ?, ?)",
+            (key, summary, time.time())
+        )
+        prune_cache_table("cluster_summaries", SUMMARY_CACHE_MAX_ROWS)
+        _embed_cache_db.commit()
+
+# ============================================================
+# REPORT CACHE + SINGLE-FLIGHT
+# ============================================================
+# Whole /api/analyze results keyed by category, comment fingerprint, draft and model versions;
+# identical requests arriving while one is running wait for it instead of starting another.
+# Reports expire after REPORT_CACHE_TTL seconds and at most REPORT_CACHE_MAX_ENTRIES are kept
+# (0 disables either); a request with "refresh": true skips the cached report
+REPORT_CACHE = os.getenv("REPORT_CACHE", "1") == "1"
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", 86400))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", 500))
+_inflight_reports = {}
+
+class CommentFingerprint:
+    """Order-independent fingerprint of comment records, built page by page
+    (sum of per-record hashes, so repeated records still count)"""
+    def __init__(self):
+        self.value = 0
     
-    return embeddings
+    def add(self, item):
+        row = "\x00".join((str(item.get('id', '')), item.get('standardComment') or '', str(item.get('sentiment', 'Neutral'))))
+        self.value = (self.value + int(hashlib.sha256(row.encode("utf-8")).hexdigest(), 16)) % (1 << 256)
+
+def report_cache_key(post_id, category_id, fingerprint, draft_text):
+    h = hashlib.sha256()
+    for part in (post_id, category_id, EMBED_MODEL_NAME, LLM_MODEL_NAME,
+                 cluster_prompt.template, final_synthesis_prompt.template, draft_text, f"{fingerprint.value:064x}"):
+        h.update(f"{part}\x00".encode("utf-8"))
+    return h.hexdigest()
+
+def report_cache_get(key):
+    with _embed_cache_lock:
+        row = _embed_cache_db.execute("SELECT report, created_at FROM reports WHERE key = ?", (key,)).fetchone()
+    if row is None or (REPORT_CACHE_TTL > 0 and time.time() - row[1] > REPORT_CACHE_TTL):
+        return None
+    return json.loads(row[0])
+
+def report_cache_put(key, report):
+    with _embed_cache_lock:
+        _embed_cache_db.execute(
+            "INSERT OR REPLACE INTO reports (key, report, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(report), time.time())
+        )
+        prune_cache_table("reports", REPORT_CACHE_MAX_ENTRIES, REPORT_CACHE_TTL)
+        _embed_cache_db.commit()
+
+async def run_single_flight(key, compute):
+    """Await compute() once per key at a time; concurrent callers with the same key share its result.
+    Returns (result, coalesced). Only runs on the analysis loop, so the in-flight map needs no lock"""
+    future = _inflight_reports.get(key)
+    if future is not None:
+        return await asyncio.shield(future), True
+    future = _inflight_reports[key] = asyncio.get_running_loop().create_future()
+    try:
+        result = await compute()
+        future.set_result(result)
+        return result, False
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight_reports.pop(key, None)
+
+async def get_embeddings_cached(texts, batch_size=250, concurrency=EMBED_CONCURRENCY, report=None):
+    """Embeddings for texts, only calling the model for texts not already in the cache.
+    Texts that failed to embed come back as None. report (see new_embed_report) carries the
+    failed-call budget across calls that belong to one run."""
+    keys = [embedding_cache_key(t) for t in texts]
+    cached = embedding_cache_get(list(set(keys)))
+
+    # Embed each missing text once, even if it appears several times
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    report = new_embed_report() if report is None else report
+    if missing:
+        new_vectors, report = await get_embeddings_async(list(missing.values()), batch_size=batch_size,
+                                                         concurrency=concurrency, report=report)
+        # Failed inputs (None) are neither cached nor returned
+        fresh = [(k, v) for k, v in zip(missing.keys(), new_vectors) if v is not None]
+        embedding_cache_put(fresh)
+        cached.update((k, np.asarray(v, dtype=np.float32)) for k, v in fresh)
+
+    hits = sum(1 for k in keys if k not in missing)
+    stats = {"hits": hits, "misses": len(keys) - hits, "embedded": len(missing), **report}
+    return [cached.get(k) for k in keys], stats
+
+def merge_prefetch_stats(prefetch, lookup):
+    """Embedding stats for comments ingestion already embedded: cache hits/misses as the prefetch
+    found them, plus whatever the analysis lookup still had to embed (inputs that failed before)"""
+    return {
+        'hits': prefetch['hits'],
+        'misses': prefetch['misses'],
+        'embedded': prefetch['embedded'] + lookup['embedded'],
+        'retried': prefetch['retried'] + lookup['retried'],
+        'failed': lookup['failed'],
+        'bisected': prefetch['bisected'] + lookup['bisected'],
+        'failed_calls': prefetch['failed_calls'] + lookup['failed_calls'],
+        'circuit_open': prefetch['circuit_open'] or lookup['circuit_open'],
+        'prefetch_seconds': prefetch['seconds'],
+    }
 
 async def ainvoke_text(prompt_text, retries=3, backoff=1.0, timeout=120):
     """Enhanced LLM invocation using sync invoke in thread pool to avoid asyncio issues"""
@@ -229,17 +566,27 @@ async def ainvoke_text(prompt_text, retries=3, backoff=1.0, timeout=120):
             await asyncio.sleep(backoff * (attempt + 1))
 
 async def summarize_cluster(cid, text, sem):
-    """Optimized cluster summarization with size limits"""
-    async with sem:
-        # Strict text size limit for LLM
-        MAX_CLUSTER_SIZE = 50000  
-        if len(text) > MAX_CLUSTER_SIZE:
-            
-            half = MAX_CLUSTER_SIZE // 2
-            text = text[:half] + f"\n\n...[{len(text) - MAX_CLUSTER_SIZE} chars omitted]...\n\n" + text[-half:]
+    """Optimized cluster summarization with size limits
+    Returns (cid, summary, cached); unchanged cluster texts are served from the summary cache"""
+    # Strict text size limit for LLM
+    MAX_CLUSTER_SIZE = 50000  
+    if len(text) > MAX_CLUSTER_SIZE:
         
-        prompt = cluster_prompt.format(cluster_id=cid, text=text)
-        return cid, await ainvoke_text(prompt, timeout=90)
+        half = MAX_CLUSTER_SIZE // 2
+        text = text[:half] + f"\n\n...[{len(text) - MAX_CLUSTER_SIZE} chars omitted]...\n\n" + text[-half:]
+    
+    key = summary_cache_key(text)
+    cached = summary_cache_get(key)
+    if cached is not None:
+        return cid, cached, True
+    
+    async with sem:
+        prompt = cluster_prompt.format(text=text)
+        summary = await ainvoke_text(prompt, timeout=90)
+    # Failed calls are retried on the next run rather than cached
+    if not summary.startswith("[ERROR]"):
+        summary_cache_put(key, summary)
+    return cid, summary, False
 
 # ============================================================
 # OPTIMIZED CLUSTERING FUNCTIONS
@@ -267,62 +614,235 @@ def propose_candidate_k(n, min_per_cluster=80, max_per_cluster=250, max_candidat
     
     return sorted(set([k for k in candidates if k <= n]))
 
-def semantic_dedupe_fast(indices, embeddings_array, threshold=0.92):
-    """Faster deduplication using approximate nearest neighbors"""
-    if len(indices) <= 1:
-        return indices
+def cluster_embeddings(E, comment_keys, post_id, category_id, weights=None):
+    """Incremental update of the stored clusters when possible, otherwise a full k-sweep
+    weights are per-row submission counts (exact duplicates collapsed before embedding)
+    Returns (Z, labels, k, score, k_sweep, stopped_early, clustering_info), Z being the (possibly
+    reduced, see reduction.py) representation that was clustered"""
+    n_samples = len(E)
+    Z = None
     
-    vecs = embeddings_array[indices]
-    m = vecs.shape[0]
+    # ============================================================
+    # INCREMENTAL CLUSTERING AGAINST STORED STATE
+    # ============================================================
+    state = load_cluster_state(post_id, category_id) if INCREMENTAL_CLUSTERING else None
+    clustering_info = {'mode': 'full'}
+    best_labels = None
+    if state is not None:
+        print("\n♻️ Updating stored clusters incrementally...")
+        if state.get('reducer_config') == reducer_config():
+            Z = apply_reducer(state.get('reducer'), E)
+            best_labels, clustering_info = assign_incremental(state, Z, comment_keys, weights)
+        else:
+            clustering_info = {'reason': 'reduction settings changed'}
+        if best_labels is not None:
+            clustering_info['mode'] = 'incremental'
+            write_cluster_state(post_id, category_id, state)
+            print(f"   ✅ {clustering_info['known_comments']} known, {clustering_info['new_comments']} new comments assigned")
+        else:
+            clustering_info['mode'] = 'full'
+            print(f"   Full recluster needed: {clustering_info['reason']}")
     
-    # For small clusters, use exact method
-    if m <= 50:
-        sim = cosine_similarity(vecs)
-        parent = list(range(m))
+    if best_labels is not None:
+        best_k, best_score, k_sweep, stopped_early = state['model'].n_clusters, None, [], False
+    else:
+        reducer = fit_reducer(E)
+        Z = apply_reducer(reducer, E)
+        if reducer is not None:
+            print(f"\n📉 Reduced embeddings {E.shape[1]} → {Z.shape[1]} dims ({REDUCE_METHOD})")
+        
+        # Memory-efficient scaling: in place, X shares Z's buffer and is unscaled again below
+        scaler = StandardScaler(with_mean=False, copy=False)
+        X = scaler.fit_transform(Z)
+        
+        # ============================================================
+        # OPTIMIZED K SELECTION WITH MINI-BATCH KMEANS
+        # ============================================================
+        print("\n🎯 Finding optimal clusters...")
+        candidate_ks = propose_candidate_k(n_samples)
+        print(f"   Candidate k: {candidate_ks}")
+        
+        # Sample size for silhouette scoring (max 1000 for speed)
+        sample_size = min(1000, n_samples)
+        sample_idx = np.random.choice(n_samples, size=sample_size, replace=False)
         
-        def find(x):
-            if parent[x] != x:
-                parent[x] = find(parent[x])
-            return parent[x]
+        # Parallel, warm-started sweep with early stopping (see clustering.py)
+        best, k_sweep, stopped_early = sweep_k(X, candidate_ks, sample_idx, sample_weight=weights)
+        for r in k_sweep:
+            print(f"   k={r['k']}: score={r['score']} fit={r['fit_s']}s{' (warm start)' if r['warm_start'] else ''}")
+        if stopped_early:
+            print("   Sweep stopped early (score no longer improving)")
         
-        def union(x, y):
-            px, py = find(x), find(y)
-            if px != py:
-                parent[px] = py
+        best_k, best_score, best_labels, model = (best["k"], best["score"], best["labels"], best["model"]) if best else (None, -2, None, None)
         
-        for i in range(m):
-            for j in range(i+1, m):
-                if sim[i, j] >= threshold:
-                    union(i, j)
+        if best_k is None:
+            print("   ⚠️ Fallback: using heuristic k")
+            best_k = min(max(3, n_samples // 150), 30)
+            model = MiniBatchKMeans(n_clusters=best_k, batch_size=256, n_init=3, random_state=42)
+            best_labels = model.fit_predict(X, sample_weight=weights)
+            best_score = -1.0
         
-        groups = {}
-        for i in range(m):
-            root = find(i)
-            if root not in groups:
-                groups[root] = i
+        print(f"   ✅ Selected k={best_k} (score={best_score:.3f})")
         
-        return [indices[i] for i in sorted(groups.values())]
+        if INCREMENTAL_CLUSTERING:
+            write_cluster_state(post_id, category_id, build_cluster_state(
+                model, scaler, X, best_labels, comment_keys, reducer, reducer_config()
+            ))
+        scaler.inverse_transform(X, copy=False)
     
-    # For large clusters, use approximate method
-    kept = [0]  # Always keep first
-    nn = NearestNeighbors(n_neighbors=min(10, m), metric='cosine', algorithm='brute')
-    nn.fit(vecs)
+    return Z, best_labels, best_k, best_score, k_sweep, stopped_early, clustering_info
+
+async def summarize_and_synthesize(clusters, sentiment_counts, n_samples, n_submissions, total_after, emit):
+    """Shared tail of both analysis modes: cluster texts -> cluster summaries -> final synthesis
+    clusters maps cluster id -> deduplicated comment texts; sentiment_counts is per submission
+    Returns (overall_summary, info)"""
+    # ============================================================
+    # PREPARE CLUSTER TEXTS (WITH SIZE LIMITS)
+    # ============================================================
+    print("\n📝 Preparing cluster texts...")
+    cluster_full_text = {}
     
-    for i in range(1, m):
-        distances, _ = nn.kneighbors([vecs[i]], n_neighbors=min(len(kept)+1, 10))
-        min_dist = distances[0][0] if len(distances[0]) > 0 else 1.0
-        similarity = 1 - min_dist
+    for cid, texts in clusters.items():
+        # Limit comments per cluster to avoid huge texts
+        MAX_COMMENTS_PER_CLUSTER = 100
+        if len(texts) > MAX_COMMENTS_PER_CLUSTER:
+            # Sample diverse comments
+            indices = np.linspace(0, len(texts)-1, MAX_COMMENTS_PER_CLUSTER, dtype=int)
+            texts = [texts[i] for i in indices]
+        
+        joined = "\n---\n".join(texts)
         
-        if similarity < threshold:
-            kept.append(i)
+        # Hard limit on cluster text size
+        MAX_SIZE = 60000
+        if len(joined) > MAX_SIZE:
+            half = MAX_SIZE // 2
+            joined = joined[:half] + f"\n\n...[{len(joined) - MAX_SIZE} chars omitted]...\n\n" + joined[-half:]
+        
+        cluster_full_text[cid] = joined
+    
+    print(f"   Prepared {len(cluster_full_text)} clusters")
+    
+    # ============================================================
+    # PARALLEL CLUSTER SUMMARIZATION
+    # ============================================================
+    print("\n🤖 Summarizing clusters...")
+    emit('summarize', 'running', clusters=len(cluster_full_text))
+    start = time.time()
+    concurrency = 8  # Balanced concurrency
+    sem = asyncio.Semaphore(concurrency)
+    
+    cluster_tasks = [summarize_cluster(cid, text, sem) for cid, text in cluster_full_text.items()]
+    
+    try:
+        cluster_results = await asyncio.gather(*cluster_tasks, return_exceptions=True)
+    except Exception as e:
+        print(f"   ⚠️ Error during cluster summarization: {str(e)}")
+        # Handle partial results
+        cluster_results = [(i, f"[ERROR] {str(e)[:100]}", False) for i in range(len(cluster_tasks))]
+    
+    # Filter out errors and build summaries
+    cluster_summaries = {}
+    cached_clusters = 0
+    failed_clusters = 0
+    for result in cluster_results:
+        if isinstance(result, tuple) and len(result) == 3:
+            cid, summary, cached = result
+            cluster_summaries[cid] = summary
+            cached_clusters += cached
+            failed_clusters += summary.startswith("[ERROR]")
+        elif isinstance(result, Exception):
+            print(f"   ⚠️ Cluster task exception: {str(result)[:100]}")
+            failed_clusters += 1
+    
+    print(f"   ✅ Cluster summaries complete ({len(cluster_summaries)} successful, {cached_clusters} from cache)")
+    emit('summarize', 'done', clusters=len(cluster_summaries), cached=cached_clusters, seconds=round(time.time() - start, 2))
+    
+    # ============================================================
+    # SENTIMENT STATS
+    # ============================================================
+    neg = sentiment_counts.get('Negative', 0)
+    pos = sentiment_counts.get('Positive', 0)
+    neu = sentiment_counts.get('Neutral', 0)
+    total = sum(sentiment_counts.values())
+    
+    sentiment_stats = f"""
+Negative: {neg} ({neg/total*100:.1f}%)
+Positive: {pos} ({pos/total*100:.1f}%)
+Neutral : {neu} ({neu/total*100:.1f}%)
+Total   : {total}
+"""
+    
+    # ============================================================
+    # FINAL SYNTHESIS
+    # ============================================================
+    print("\n📊 Final synthesis...")
+    cluster_summaries_text = "\n\n".join([
+        f"=== CLUSTER {cid} ===\n{cluster_summaries[cid]}"
+        for cid in sorted(cluster_summaries.keys())
+    ])
+    
+    # Limit final summary size
+    MAX_FINAL_SIZE = 100000
+    if len(cluster_summaries_text) > MAX_FINAL_SIZE:
+        cluster_summaries_text = cluster_summaries_text[:MAX_FINAL_SIZE] + "\n\n...[truncated]..."
+    
+    sentiment_and_cluster_data = f"""{sentiment_stats}
+Total Clusters Identified: {len(cluster_summaries)}
+Unique Comment Texts: {n_samples} (from {n_submissions} submissions)
+Comments After Deduplication: {total_after}
+"""
+    
+    final_prompt = final_synthesis_prompt.format(
+        cluster_summaries=cluster_summaries_text,
+        sentiment_stats=sentiment_and_cluster_data,
+        total_comments=total_after
+    )
+    
+    # Try final synthesis with extended timeout and fallback
+    print("   Starting final synthesis (may take 3-5 minutes)...")
+    emit('synthesize', 'running')
+    start = time.time()
+    synthesis_complete = True
+    try:
+        overall_summary = await asyncio.wait_for(
+            ainvoke_text(final_prompt, timeout=240, retries=2),
+            timeout=300  # 5 minute hard limit
+        )
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        print(f"   ⚠️ Final synthesis timeout/cancelled: {str(e)}")
+        synthesis_complete = False
+        # Fallback: Return cluster summaries directly
+        overall_summary = f"""[ANALYSIS SUMMARY - Generated from {len(cluster_summaries)} clusters]
+
+{sentiment_stats}
+
+CLUSTER INSIGHTS:
+{cluster_summaries_text[:50000]}
+
+[Note: Full AI synthesis timed out - showing cluster summaries directly]"""
     
-    return [indices[i] for i in kept]
+    print("   ✅ Synthesis complete")
+    emit('synthesize', 'done', complete=synthesis_complete, seconds=round(time.time() - start, 2))
+    return overall_summary, {
+        'synthesis_complete': synthesis_complete and not overall_summary.startswith("[ERROR]"),
+        'cluster_summaries': {
+            'total': len(cluster_summaries),
+            'cached': cached_clusters,
+            'failed': failed_clusters
+        }
+    }
 
 # ============================================================
 # OPTIMIZED MAIN ANALYSIS FUNCTION
 # ============================================================
-async def analyze_comments_async(comments, sentiments, draft_text):
-    """Optimized main analysis pipeline for 1000+ comments"""
+async def analyze_comments_async(comments, sentiment_counts, draft_text, post_id="default", category_id="overall", progress=None,
+                                 prefetch=None):
+    """Optimized main analysis pipeline for 1000+ comments
+    Clustering is incremental against the stored state for (post_id, category_id) when possible
+    progress(stage, status, **info) is called as each stage starts and finishes
+    prefetch: ingest_comments' embedding stats when it already embedded these comments
+    Returns (summary, run_info) where run_info carries per-run stats for the response metadata"""
+    emit = progress or (lambda stage, status, **info: None)
     
     n_samples = len(comments)
     print(f"\n📊 Comment count: {n_samples}")
@@ -350,76 +870,80 @@ async def analyze_comments_async(comments, sentiments, draft_text):
     if n_samples < 3:
         raise ValueError("Need at least 3 comments for clustering")
     
+    # ============================================================
+    # EXACT-DUPLICATE PREFILTER
+    # ============================================================
+    # Copy-paste campaigns are collapsed to one text with a submission count before anything is
+    # embedded; sentiment stats below stay per submission
+    first_idx, _, weights = exact_duplicate_groups(comments)
+    n_submissions = n_samples
+    comments = [comments[i] for i in first_idx]
+    n_samples = len(comments)
+    print(f"\n🧬 {n_submissions} submissions → {n_samples} unique texts")
+    if n_samples < 3:
+        raise ValueError("Need at least 3 distinct comments for clustering")
+    
     # ============================================================
     # OPTIMIZED EMBEDDING
     # ============================================================
     print("\n🔢 Generating embeddings...")
+    if prefetch is None:
+        emit('embed', 'running', count=n_samples)
     start = time.time()
     
-    # Truncate very long comments to avoid API issues
-    MAX_COMMENT_LENGTH = 5000
-    truncated_comments = [c[:MAX_COMMENT_LENGTH] if len(c) > MAX_COMMENT_LENGTH else c for c in comments]
+    truncated_comments = [c[:MAX_COMMENT_LENGTH] for c in comments]
     
-    embeddings = await get_embeddings_async(truncated_comments, batch_size=250, concurrency=15)
-    print(f"   ✅ Embedded {len(comments)} comments in {time.time() - start:.2f}s")
+    embeddings, embed_cache_stats = await get_embeddings_cached(truncated_comments, batch_size=250, concurrency=EMBED_CONCURRENCY)
+    if prefetch is not None:
+        embed_cache_stats = merge_prefetch_stats(prefetch, embed_cache_stats)
+    print(f"   ✅ Embedded {len(comments)} comments in {time.time() - start:.2f}s "
+          f"(cache hits: {embed_cache_stats['hits']}, misses: {embed_cache_stats['misses']})")
     
-    E = np.array(embeddings, dtype=np.float32)
+    # Comments that could not be embedded are left out of clustering instead of poisoning it
+    comment_keys = [embedding_cache_key(t) for t in truncated_comments]
+    failed_idx = [i for i, v in enumerate(embeddings) if v is None]
+    if failed_idx:
+        keep = [i for i, v in enumerate(embeddings) if v is not None]
+        print(f"   ⚠️ Excluding {len(failed_idx)} comments that failed to embed")
+        comments = [comments[i] for i in keep]
+        embeddings = [embeddings[i] for i in keep]
+        comment_keys = [comment_keys[i] for i in keep]
+        weights = weights[keep]
+        n_samples = len(comments)
+        if n_samples < 3:
+            raise ValueError("Need at least 3 embedded comments for clustering")
     
-    # Memory-efficient scaling
-    scaler = StandardScaler(with_mean=False)
-    X = scaler.fit_transform(E)
+    E = np.array(embeddings, dtype=np.float32)
+    del embeddings
+    emit('embed', 'done', count=n_samples, failed=len(failed_idx), cache_hits=embed_cache_stats['hits'],
+         cache_misses=embed_cache_stats['misses'],
+         seconds=round(time.time() - start + (prefetch['seconds'] if prefetch else 0), 2))
     
     # ============================================================
-    # OPTIMIZED K SELECTION WITH MINI-BATCH KMEANS
+    # CLUSTERING (CPU-bound, kept off the event loop)
     # ============================================================
-    print("\n🎯 Finding optimal clusters...")
-    candidate_ks = propose_candidate_k(n_samples)
-    print(f"   Candidate k: {candidate_ks}")
-    
-    best_k, best_score, best_labels = None, -2, None
-    
-    # Sample size for silhouette scoring (max 1000 for speed)
-    sample_size = min(1000, n_samples)
-    sample_idx = np.random.choice(n_samples, size=sample_size, replace=False)
-    
-    for k in candidate_ks:
-        try:
-            # Use MiniBatchKMeans for large datasets (much faster)
-            if n_samples > 500:
-                km = MiniBatchKMeans(
-                    n_clusters=k, 
-                    batch_size=256,
-                    n_init=3, 
-                    random_state=42,
-                    max_iter=100
-                )
-            else:
-                from sklearn.cluster import KMeans
-                km = KMeans(n_clusters=k, n_init=5, random_state=42)
-            
-            labels = km.fit_predict(X)
-            
-            if len(set(labels)) < 2:
-                continue
-            
-            # Calculate silhouette score on sample only
-            score = silhouette_score(X[sample_idx], labels[sample_idx], sample_size=min(500, sample_size))
-            
-            if score > best_score:
-                best_k, best_score, best_labels = k, score, labels
-                
-        except Exception as e:
-            print(f"   ⚠️ K={k} failed: {e}")
-            continue
-    
-    if best_k is None:
-        print("   ⚠️ Fallback: using heuristic k")
-        best_k = min(max(3, n_samples // 150), 30)
-        km = MiniBatchKMeans(n_clusters=best_k, batch_size=256, n_init=3, random_state=42)
-        best_labels = km.fit_predict(X)
-        best_score = -1.0
+    emit('cluster', 'running')
+    start = time.time()
+    Z, best_labels, best_k, best_score, k_sweep, stopped_early, clustering_info = await asyncio.to_thread(
+        cluster_embeddings, E, comment_keys, post_id, category_id, weights
+    )
     
-    print(f"   ✅ Selected k={best_k} (score={best_score:.3f})")
+    # With reduction on, dedupe works on the compact Z too; a sample of the full embeddings is kept
+    # to measure what the reduction cost in cluster quality
+    reduction_info = {'method': REDUCE_METHOD, 'dim': int(Z.shape[1])}
+    if Z is not E:
+        if REDUCE_QUALITY_SAMPLE > 0:
+            q_idx = np.random.default_rng(0).choice(n_samples, size=min(REDUCE_QUALITY_SAMPLE, n_samples), replace=False)
+            reduction_info['original_dim'] = int(E.shape[1])
+            reduction_info['quality'] = await asyncio.to_thread(
+                reduction_quality, E[q_idx], best_labels[q_idx], int(best_k)
+            )
+        E = Z
+    elif EMBED_OUTPUT_DIM:
+        # The model returned the reduced vectors directly, so there is no full-dimension sample to compare
+        reduction_info['quality'] = None
+        reduction_info['quality_unavailable'] = "output_dim embeddings have no full-dimension baseline"
+    emit('cluster', 'done', mode=clustering_info['mode'], k=int(best_k), seconds=round(time.time() - start, 2))
     
     # ============================================================
     # BUILD CLUSTERS
@@ -438,17 +962,23 @@ async def analyze_comments_async(comments, sentiments, draft_text):
     # OPTIMIZED SEMANTIC DEDUPLICATION
     # ============================================================
     print("\n🔍 Running semantic deduplication...")
+    emit('dedupe', 'running', clusters=len(cluster_indices))
+    start = time.time()
     new_clusters = {}
     total_before = 0
     total_after = 0
     
+    def cluster_text(i):
+        # Lets the summaries say how often a text was submitted
+        return f"[submitted {weights[i]} times] {comments[i]}" if weights[i] > 1 else comments[i]
+    
     # Process clusters in parallel
     async def dedupe_cluster(cid, idxs):
         if len(idxs) <= 1:
-            return cid, [comments[i] for i in idxs], len(idxs), len(idxs)
+            return cid, [cluster_text(i) for i in idxs], len(idxs), len(idxs)
         
-        keep_indices = semantic_dedupe_fast(idxs, E, threshold=0.92)
-        return cid, [comments[i] for i in keep_indices], len(idxs), len(keep_indices)
+        keep_indices = await asyncio.to_thread(semantic_dedupe_fast, idxs, E, 0.92)
+        return cid, [cluster_text(i) for i in keep_indices], len(idxs), len(keep_indices)
     
     dedupe_tasks = [dedupe_cluster(cid, idxs) for cid, idxs in cluster_indices.items()]
     dedupe_results = await asyncio.gather(*dedupe_tasks)
@@ -465,236 +995,561 @@ async def analyze_comments_async(comments, sentiments, draft_text):
     print(f"      Before: {total_before} comments")
     print(f"      After:  {total_after} comments")
     print(f"      Removed: {total_before - total_after} duplicates ({reduction_pct:.1f}%)")
+    emit('dedupe', 'done', before=total_before, after=total_after, seconds=round(time.time() - start, 2))
     
     # ============================================================
-    # PREPARE CLUSTER TEXTS (WITH SIZE LIMITS)
+    # SUMMARIES + SYNTHESIS
     # ============================================================
-    print("\n📝 Preparing cluster texts...")
-    cluster_full_text = {}
+    overall_summary, summary_info = await summarize_and_synthesize(
+        clusters, sentiment_counts, n_samples, n_submissions, total_after, emit
+    )
+    run_info = {
+        'synthesis_complete': summary_info['synthesis_complete'],
+        'exact_duplicates': {
+            'submissions': n_submissions,
+            'unique_texts': len(first_idx),
+            'largest_group': int(weights.max()) if len(weights) else 0
+        },
+        'embedding': embed_cache_stats,
+        'reduction': reduction_info,
+        'clustering': clustering_info,
+        'cluster_summaries': summary_info['cluster_summaries'],
+        'k_selection': {
+            'selected_k': int(best_k),
+            'score': round(float(best_score), 4) if best_score is not None else None,
+            'stopped_early': stopped_early,
+            'candidates': k_sweep
+        }
+    }
+    return overall_summary, run_info
+
+# ============================================================
+# SHARDED (OUT-OF-CORE) ANALYSIS
+# ============================================================
+# ANALYSIS_MODE=sharded keeps unique texts in SQLite and embeddings in a float16 memmap
+# (corpus_store.py), fits k-means shard by shard and holds clusters as index arrays, so memory no
+# longer grows with comment strings or embedding lists
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "memory").lower()
+SHARD_ROWS = int(os.getenv("SHARD_ROWS", 10000))
+SHARD_EPOCHS = int(os.getenv("SHARD_EPOCHS", 2))
+# In-memory sample the k-sweep (and the reducer) is fitted on
+SHARD_SAMPLE_ROWS = int(os.getenv("SHARD_SAMPLE_ROWS", 20000))
+# Per-cluster cap for semantic dedupe; only 100 texts per cluster reach the LLM anyway
+SHARD_DEDUPE_ROWS = int(os.getenv("SHARD_DEDUPE_ROWS", 5000))
+
+def cluster_embeddings_sharded(E, rows, weights):
+    """k from the warm-started sweep on an in-memory sample, then partial_fit over all shards
+    Returns (labels for rows, k, score, k_sweep, stopped_early, reducer)"""
+    rng = np.random.default_rng(42)
+    sample_rows = np.sort(rng.choice(rows, size=min(SHARD_SAMPLE_ROWS, len(rows)), replace=False))
+    sample = np.asarray(E[sample_rows], dtype=np.float32)
+    reducer = fit_reducer(sample)
+    scaler = StandardScaler(with_mean=False)
+    X_sample = scaler.fit_transform(apply_reducer(reducer, sample))
+    del sample
     
-    for cid, texts in clusters.items():
-        # Limit comments per cluster to avoid huge texts
-        MAX_COMMENTS_PER_CLUSTER = 100
-        if len(texts) > MAX_COMMENTS_PER_CLUSTER:
-            # Sample diverse comments
-            indices = np.linspace(0, len(texts)-1, MAX_COMMENTS_PER_CLUSTER, dtype=int)
-            texts = [texts[i] for i in indices]
-        
-        joined = "\n---\n".join(texts)
-        
-        # Hard limit on cluster text size
-        MAX_SIZE = 60000
-        if len(joined) > MAX_SIZE:
-            half = MAX_SIZE // 2
-            joined = joined[:half] + f"\n\n...[{len(joined) - MAX_SIZE} chars omitted]...\n\n" + joined[-half:]
-        
-        cluster_full_text[cid] = joined
+    def transform(shard):
+        return scaler.transform(apply_reducer(reducer, np.asarray(E[shard], dtype=np.float32)))
     
-    print(f"   Prepared {len(cluster_full_text)} clusters")
+    print("\n🎯 Finding optimal clusters on a sample...")
+    candidate_ks = propose_candidate_k(len(rows))
+    sample_idx = rng.choice(len(sample_rows), size=min(1000, len(sample_rows)), replace=False)
+    best, k_sweep, stopped_early = sweep_k(X_sample, candidate_ks, sample_idx, sample_weight=weights[sample_rows])
+    if best:
+        best_k, best_score, init = best["k"], best["score"], best["centers"]
+    else:
+        print("   ⚠️ Fallback: using heuristic k")
+        best_k = min(max(3, len(rows) // 150), 30)
+        init = MiniBatchKMeans(n_clusters=best_k, batch_size=256, n_init=3, random_state=42).fit(
+            X_sample, sample_weight=weights[sample_rows]
+        ).cluster_centers_
+        best_score = -1.0
+    print(f"   ✅ Selected k={best_k} (score={best_score:.3f}); fitting {len(rows)} rows in shards of {SHARD_ROWS}")
+    
+    km = fit_kmeans_sharded(transform, rows, weights, init, SHARD_ROWS, SHARD_EPOCHS)
+    labels = predict_sharded(km, transform, rows, SHARD_ROWS)
+    return labels, best_k, best_score, k_sweep, stopped_early, reducer
+
+async def analyze_comments_sharded(store, sentiment_counts, post_id="default", category_id="overall", progress=None,
+                                   prefetch=None):
+    """Out-of-core counterpart of analyze_comments_async for very large consultations
+    Embeddings were written to the store during ingestion (prefetch holds that step's stats); the
+    clustered comments are never all in memory as strings or float32 rows, only as integer
+    index/weight/label arrays
+    Returns (summary, run_info)"""
+    emit = progress or (lambda stage, status, **info: None)
+    n_submissions = sum(sentiment_counts.values())
+    n_samples = store.count
+    print(f"\n📊 Comment count: {n_submissions} ({n_samples} unique texts, sharded mode)")
+    
+    E = store.embeddings()
+    failed = np.frombuffer(bytes(store.failed), dtype=np.uint8).astype(bool)
+    rows = np.flatnonzero(~failed)
+    weights = store.weights()
+    if failed.any():
+        print(f"   ⚠️ Excluding {int(failed.sum())} comments that failed to embed")
+    prefetch = prefetch or {}
+    emit('embed', 'done', count=len(rows), failed=int(failed.sum()), cache_hits=prefetch.get('hits'),
+         cache_misses=prefetch.get('misses'), seconds=prefetch.get('seconds'))
+    if len(rows) < 3:
+        raise ValueError("Need at least 3 embedded comments for clustering")
     
     # ============================================================
-    # PARALLEL CLUSTER SUMMARIZATION
+    # CLUSTERING OVER SHARDS
     # ============================================================
-    print("\n🤖 Summarizing clusters...")
-    concurrency = 8  # Balanced concurrency
-    sem = asyncio.Semaphore(concurrency)
+    emit('cluster', 'running')
+    start = time.time()
+    labels, best_k, best_score, k_sweep, stopped_early, reducer = await asyncio.to_thread(
+        cluster_embeddings_sharded, E, rows, weights
+    )
+    # Cluster membership as index arrays into the memmap
+    order = np.argsort(labels, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=best_k))])
+    cluster_rows = {
+        cid: rows[order[bounds[cid]:bounds[cid + 1]]]
+        for cid in range(best_k) if bounds[cid + 1] > bounds[cid]
+    }
+    del order, labels
+    emit('cluster', 'done', mode='sharded', k=int(best_k), seconds=round(time.time() - start, 2))
+    print(f"   Created {len(cluster_rows)} clusters")
     
-    cluster_tasks = [summarize_cluster(cid, text, sem) for cid, text in cluster_full_text.items()]
+    # ============================================================
+    # BOUNDED SEMANTIC DEDUPLICATION
+    # ============================================================
+    print("\n🔍 Running semantic deduplication...")
+    emit('dedupe', 'running', clusters=len(cluster_rows))
+    start = time.time()
     
-    try:
-        cluster_results = await asyncio.gather(*cluster_tasks, return_exceptions=True)
-    except Exception as e:
-        print(f"   ⚠️ Error during cluster summarization: {str(e)}")
-        # Handle partial results
-        cluster_results = [(i, f"[ERROR] {str(e)[:100]}") for i in range(len(cluster_tasks))]
+    async def dedupe_cluster(cid, members):
+        if len(members) > SHARD_DEDUPE_ROWS:
+            members = members[np.linspace(0, len(members) - 1, SHARD_DEDUPE_ROWS, dtype=int)]
+        if len(members) <= 1:
+            return cid, members, len(members)
+        keep = await asyncio.to_thread(semantic_dedupe_fast, members, E, 0.92)
+        return cid, np.asarray(keep), len(members)
     
-    # Filter out errors and build summaries
-    cluster_summaries = {}
-    for result in cluster_results:
-        if isinstance(result, tuple) and len(result) == 2:
-            cid, summary = result
-            cluster_summaries[cid] = summary
-        elif isinstance(result, Exception):
-            print(f"   ⚠️ Cluster task exception: {str(result)[:100]}")
+    dedupe_results = await asyncio.gather(*[dedupe_cluster(cid, m) for cid, m in cluster_rows.items()])
+    total_before = sum(before for _, _, before in dedupe_results)
+    total_after = sum(len(keep) for _, keep, _ in dedupe_results)
+    print(f"    Deduplication complete! Before: {total_before} (sampled) After: {total_after}")
+    emit('dedupe', 'done', before=total_before, after=total_after, seconds=round(time.time() - start, 2))
     
-    print(f"   ✅ Cluster summaries complete ({len(cluster_summaries)} successful)")
+    # Only the texts that can reach the LLM are read back from disk
+    MAX_COMMENTS_PER_CLUSTER = 100
+    clusters = {}
+    for cid, keep, _ in dedupe_results:
+        if len(keep) > MAX_COMMENTS_PER_CLUSTER:
+            keep = keep[np.linspace(0, len(keep) - 1, MAX_COMMENTS_PER_CLUSTER, dtype=int)]
+        clusters[cid] = [
+            f"[submitted {weights[r]} times] {text}" if weights[r] > 1 else text
+            for r, text in zip(keep, store.texts(keep))
+        ]
     
     # ============================================================
-    # SENTIMENT STATS
+    # SUMMARIES + SYNTHESIS
     # ============================================================
-    df = pd.DataFrame({'sentiment': sentiments})
-    neg = (df['sentiment'] == 'Negative').sum()
-    pos = (df['sentiment'] == 'Positive').sum()
-    neu = (df['sentiment'] == 'Neutral').sum()
-    total = len(df)
+    overall_summary, summary_info = await summarize_and_synthesize(
+        clusters, sentiment_counts, n_samples, n_submissions, total_after, emit
+    )
+    run_info = {
+        'synthesis_complete': summary_info['synthesis_complete'],
+        'exact_duplicates': {
+            'submissions': n_submissions,
+            'unique_texts': n_samples,
+            'largest_group': int(weights.max()) if len(weights) else 0
+        },
+        'embedding': prefetch,
+        'reduction': {'method': REDUCE_METHOD, 'dim': int(reducer.n_components if reducer is not None else E.shape[1])},
+        'clustering': {
+            'mode': 'sharded',
+            'rows': int(len(rows)),
+            'shard_rows': SHARD_ROWS,
+            'shards': math.ceil(len(rows) / SHARD_ROWS),
+            'epochs': SHARD_EPOCHS,
+            'sample_rows': int(min(SHARD_SAMPLE_ROWS, len(rows)))
+        },
+        'cluster_summaries': summary_info['cluster_summaries'],
+        'k_selection': {
+            'selected_k': int(best_k),
+            'score': round(float(best_score), 4),
+            'stopped_early': stopped_early,
+            'candidates': k_sweep
+        }
+    }
+    return overall_summary, run_info
+
+# ============================================================
+# ANALYSIS RUNNER (PERSISTENT BACKGROUND EVENT LOOP)
+# ============================================================
+class AnalysisInputError(Exception):
+    """Missing draft or comments; carries the HTTP status to answer with"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# Every analysis runs on one long-lived event loop; at most ANALYSIS_CONCURRENCY of them ingest and
+# analyze at once (coalesced requests do not take a slot)
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", 2))
+_analysis_loop = asyncio.new_event_loop()
+threading.Thread(target=_analysis_loop.run_forever, name="analysis-loop", daemon=True).start()
+_analysis_slots = asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+
+def run_on_analysis_loop(coro):
+    """Schedule a coroutine on the analysis loop; returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, _analysis_loop)
+
+def load_draft():
+    """Read draft.txt from the current directory"""
+    draft_path = os.path.join(os.getcwd(), 'draft.txt')
+    if not os.path.exists(draft_path):
+        raise AnalysisInputError(404, 'draft.txt not found in current directory')
     
-    sentiment_stats = f"""
-Negative: {neg} ({neg/total*100:.1f}%)
-Positive: {pos} ({pos/total*100:.1f}%)
-Neutral : {neu} ({neu/total*100:.1f}%)
-Total   : {total}
-"""
+    with open(draft_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def fetch_comment_page(session, category_id, cursor=None):
+    """One page of raw comment records from the backend API; returns (records, next cursor or None)
+    Backends without cursor pagination answer with everything and no nextCursor"""
+    # Build API URL with categoryId parameter
+    params = {'categoryId': category_id}
+    if COMMENTS_PAGE_SIZE > 0:
+        params['limit'] = COMMENTS_PAGE_SIZE
+        if cursor:
+            params['cursor'] = cursor
     
-    # ============================================================
-    # FINAL SYNTHESIS
-    # ============================================================
-    print("\n📊 Final synthesis...")
-    cluster_summaries_text = "\n\n".join([
-        f"=== CLUSTER {cid} ===\n{cluster_summaries[cid]}"
-        for cid in sorted(cluster_summaries.keys())
-    ])
+    # Fetch comments from API with reasonable timeout (5 minutes)
+    print(f"🌐 Fetching comments from: {API_URL} {params}")
+    response = session.get(API_URL, params=params, timeout=300)  # 5 minute timeout
+    response.raise_for_status()
     
-    # Limit final summary size
-    MAX_FINAL_SIZE = 100000
-    if len(cluster_summaries_text) > MAX_FINAL_SIZE:
-        cluster_summaries_text = cluster_summaries_text[:MAX_FINAL_SIZE] + "\n\n...[truncated]..."
+    api_data = response.json()
+
+    # Handle different API response structures
+    if isinstance(api_data, list):
+        # Direct list response
+        return api_data, None
+    elif isinstance(api_data, dict):
+        if api_data.get('statusCode') != 200:
+            raise AnalysisInputError(400, 'API returned non-200 status')
+        
+        # Check if data is directly a list or nested in comments
+        data_field = api_data.get('data', {})
+        if isinstance(data_field, list):
+            return data_field, None
+        elif isinstance(data_field, dict):
+            return data_field.get('comments', []), data_field.get('nextCursor')
+    return [], None
+
+async def ingest_comments(category_id, emit, store=None):
+    """Page through the category's comments, keeping only text and sentiment of non-empty ones.
+    Each page's embeddings are fetched while the next page downloads: into the embedding cache,
+    where the analysis later finds them, or, with a ShardedCorpus store, straight into the store
+    (unique texts then live on disk and comments comes back as None). This is the embed stage:
+    its start is emitted here and stats['embedding'] carries its cache hits/misses and time.
+    Returns (comments, sentiment_counts, fingerprint, stats)"""
+    start = time.time()
+    comments = [] if store is None else None
+    sentiment_counts = Counter()
+    fingerprint = CommentFingerprint()
+    stats = {'pages': 0, 'records': 0, 'comments': 0}
+    pending, cursor = None, None
+    seen = set()  # exact-duplicate keys; only the first copy of a text is worth prefetching
+    embed_report = new_embed_report()  # one failed-call budget for all pages
+    embed_stats = {'hits': 0, 'misses': 0, 'embedded': 0, 'seconds': 0.0}
+    embedding_started = False
     
-    sentiment_and_cluster_data = f"""{sentiment_stats}
-Total Clusters Identified: {len(cluster_summaries)}
-Comments After Deduplication: {total_after}
-"""
+    async def prefetch(texts):
+        t0 = time.time()
+        vectors, cache_stats = await get_embeddings_cached(texts, batch_size=250, concurrency=EMBED_CONCURRENCY,
+                                                           report=embed_report)
+        embed_stats['seconds'] += time.time() - t0
+        for k in ('hits', 'misses', 'embedded'):
+            embed_stats[k] += cache_stats[k]
+        if store is not None:
+            store.append_embeddings(vectors)
     
-    final_prompt = final_synthesis_prompt.format(
-        cluster_summaries=cluster_summaries_text,
-        sentiment_stats=sentiment_and_cluster_data,
-        total_comments=total_after
+    with requests.Session() as session:
+        while True:
+            records, cursor = await asyncio.to_thread(fetch_comment_page, session, category_id, cursor)
+            if pending is not None:
+                await pending
+            
+            page_comments = []
+            for item in records:
+                fingerprint.add(item)
+                text = item.get('standardComment') or ''
+                # Filter out empty comments
+                if text.strip():
+                    page_comments.append(text)
+                    sentiment_counts[item.get('sentiment', 'Neutral')] += 1
+            stats['pages'] += 1
+            stats['records'] += len(records)
+            stats['comments'] += len(page_comments)
+            
+            if store is not None:
+                page_texts = [text[:MAX_COMMENT_LENGTH] for _, text in store.add(page_comments)]
+            else:
+                comments.extend(page_comments)
+                page_texts = []
+                for text in page_comments:
+                    key = exact_duplicate_key(text)
+                    if key not in seen:
+                        seen.add(key)
+                        page_texts.append(text[:MAX_COMMENT_LENGTH])
+            emit('fetch', 'running', count=stats['comments'], pages=stats['pages'])
+            
+            if page_texts and not embedding_started:
+                emit('embed', 'running')
+                embedding_started = True
+            pending = asyncio.create_task(prefetch(page_texts)) if page_texts else None
+            if not cursor or not records:
+                break
+    if pending is not None:
+        await pending
+    
+    if not stats['records']:
+        raise AnalysisInputError(400, 'No comments found in API response')
+    stats['seconds'] = round(time.time() - start, 2)
+    stats['embedding'] = {**embed_stats, 'seconds': round(embed_stats['seconds'], 2), **embed_report}
+    return comments, sentiment_counts, fingerprint, stats
+
+def ingest_flight_key(post_id, category_id, draft_text, refresh=False):
+    """Single-flight key known before anything is fetched; the report cache key needs the comments"""
+    return hashlib.sha256(f"{post_id}\x00{category_id}\x00{draft_text}\x00{refresh}".encode("utf-8")).hexdigest()
+
+async def build_report(post_id, category_id, progress=None, refresh=False):
+    """Fetch, analyze and summarize one category; returns the response data (summary + metadata)
+    progress(stage, status, **info) receives stage updates (fetch, embed, cluster, dedupe, summarize, synthesize)
+    refresh skips the cached report (the fresh one still replaces it)"""
+    start_time = time.time()
+    
+    draft_text = load_draft()
+    print(f"📄 Draft loaded: {len(draft_text)} characters")
+    
+    async def compute_report():
+        # Ingestion embeds while it fetches, so it holds a slot just like the analysis
+        async with _analysis_slots:
+            store = ShardedCorpus() if ANALYSIS_MODE == 'sharded' else None
+            try:
+                return await ingest_and_analyze(post_id, category_id, draft_text, progress, store, refresh)
+            finally:
+                if store is not None:
+                    store.close()
+    
+    # Concurrent requests for the same post/category/draft share one ingest + analysis
+    (report, cache_status, ingest_stats), coalesced = await run_single_flight(
+        ingest_flight_key(post_id, category_id, draft_text, refresh), compute_report
     )
+    if coalesced:
+        cache_status = 'coalesced'
+    print(f"🗃️ Report cache: {cache_status}")
     
-    # Try final synthesis with extended timeout and fallback
-    print("   Starting final synthesis (may take 3-5 minutes)...")
-    try:
-        overall_summary = await asyncio.wait_for(
-            ainvoke_text(final_prompt, timeout=240, retries=2),
-            timeout=300  # 5 minute hard limit
+    elapsed = time.time() - start_time
+    print(f"\n✅ Total time: {elapsed:.2f}s ({elapsed/60:.2f} min)")
+    
+    return {
+        'summary': report['summary'],
+        'metadata': {
+            'category_id': category_id,
+            'total_comments': ingest_stats['comments'],
+            'processing_time_seconds': round(elapsed, 2),
+            'draft_length': len(draft_text),
+            'ingest': ingest_stats,
+            'report_cache': cache_status,
+            **report['run_info']
+        }
+    }
+
+async def ingest_and_analyze(post_id, category_id, draft_text, progress, store, refresh=False):
+    """Ingest the category, then reuse a cached report for the same inputs or run the analysis
+    Returns (report, cache status, ingest stats)"""
+    emit = progress or (lambda stage, status, **info: None)
+    
+    emit('fetch', 'running')
+    comments, sentiment_counts, fingerprint, ingest_stats = await ingest_comments(category_id, emit, store)
+    prefetch = ingest_stats.pop('embedding')
+    
+    print(f"💬 Fetched {ingest_stats['comments']} valid comments in {ingest_stats['pages']} page(s)")
+    emit('fetch', 'done', count=ingest_stats['comments'], pages=ingest_stats['pages'], seconds=ingest_stats['seconds'])
+    
+    report_key = report_cache_key(post_id, category_id, fingerprint, draft_text)
+    cached = report_cache_get(report_key) if REPORT_CACHE and not refresh else None
+    if cached is not None:
+        emit('embed', 'done', cache_hits=prefetch['hits'], cache_misses=prefetch['misses'], seconds=prefetch['seconds'])
+        return cached, 'hit', ingest_stats
+    
+    if store is not None:
+        summary, run_info = await analyze_comments_sharded(
+            store, sentiment_counts, post_id, category_id, progress=progress, prefetch=prefetch
         )
-    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
-        print(f"   ⚠️ Final synthesis timeout/cancelled: {str(e)}")
-        # Fallback: Return cluster summaries directly
-        overall_summary = f"""[ANALYSIS SUMMARY - Generated from {len(cluster_summaries)} clusters]
+    else:
+        summary, run_info = await analyze_comments_async(
+            comments, sentiment_counts, draft_text, post_id, category_id, progress=progress, prefetch=prefetch
+        )
+    report = {'summary': summary, 'run_info': run_info}
+    # Degraded reports (synthesis fallback or failed cluster summaries) are not cached
+    if REPORT_CACHE and run_info['synthesis_complete'] and not run_info['cluster_summaries']['failed']:
+        report_cache_put(report_key, report)
+    return report, 'miss', ingest_stats
 
-{sentiment_stats}
+def describe_analysis_error(e):
+    """(HTTP status, message) for an exception raised by build_report"""
+    if isinstance(e, AnalysisInputError):
+        return e.status, str(e)
+    if isinstance(e, requests.RequestException):
+        print(f"❌ API Error: {e}")
+        return 500, f'Failed to fetch comments from API: {str(e)}'
+    print(f"❌ Analysis Error: {e}")
+    import traceback
+    traceback.print_exception(type(e), e, e.__traceback__)
+    return 500, f'Analysis failed: {str(e)}'
 
-CLUSTER INSIGHTS:
-{cluster_summaries_text[:50000]}
+# ============================================================
+# ANALYSIS JOBS
+# ============================================================
+# Jobs live in memory (single gunicorn worker); the oldest finished ones beyond
+# ANALYSIS_JOB_HISTORY are dropped
+ANALYSIS_JOB_HISTORY = int(os.getenv("ANALYSIS_JOB_HISTORY", 100))
+SSE_KEEPALIVE_SECONDS = 15
+_jobs = {}
+_jobs_cond = threading.Condition()
 
-[Note: Full AI synthesis timed out - showing cluster summaries directly]"""
-    
-    print("   ✅ Synthesis complete")
-    return overall_summary
+def create_analysis_job(post_id, category_id, refresh=False):
+    job = {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'postId': post_id,
+        'categoryId': category_id,
+        'refresh': refresh,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'stages': {},
+        'events': [],
+        'result': None,
+        'error': None
+    }
+    with _jobs_cond:
+        _jobs[job['id']] = job
+        finished = [j for j in _jobs.values() if j['status'] in ('completed', 'failed')]
+        for old in finished[:max(0, len(finished) - ANALYSIS_JOB_HISTORY)]:
+            _jobs.pop(old['id'], None)
+    run_on_analysis_loop(run_analysis_job(job))
+    return job
+
+def record_job_event(job, stage, status, **info):
+    event = {'stage': stage, 'status': status, 'elapsed': round(time.time() - job['created_at'], 2), **info}
+    with _jobs_cond:
+        job['events'].append(event)
+        job['stages'][stage] = {k: v for k, v in event.items() if k != 'stage'}
+        _jobs_cond.notify_all()
+
+async def run_analysis_job(job):
+    with _jobs_cond:
+        job['status'], job['started_at'] = 'running', time.time()
+        _jobs_cond.notify_all()
+    try:
+        result = await build_report(
+            job['postId'], job['categoryId'],
+            progress=lambda stage, status, **info: record_job_event(job, stage, status, **info),
+            refresh=job['refresh']
+        )
+        outcome = {'status': 'completed', 'result': result}
+    except Exception as e:
+        outcome = {'status': 'failed', 'error': describe_analysis_error(e)[1]}
+    with _jobs_cond:
+        job.update(outcome, finished_at=time.time())
+        _jobs_cond.notify_all()
+
+def job_view(job):
+    with _jobs_cond:
+        return {k: v for k, v in job.items() if k != 'events'}
+
+def job_event_stream(job):
+    """Server-sent events: one 'progress' event per stage update, then a final event named after the job status"""
+    sent = 0
+    while True:
+        with _jobs_cond:
+            woke = True
+            if len(job['events']) == sent and job['status'] in ('queued', 'running'):
+                woke = _jobs_cond.wait(timeout=SSE_KEEPALIVE_SECONDS)
+            events = job['events'][sent:]
+            finished = job['status'] not in ('queued', 'running')
+        sent += len(events)
+        for event in events:
+            yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+        if finished:
+            yield f"event: {job['status']}\ndata: {json.dumps(job_view(job))}\n\n"
+            return
+        if not events and not woke:
+            yield ": keep-alive\n\n"
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
     """
     Main endpoint to analyze policy draft
     Accepts categoryId in request body to filter comments by category
+    Accepts optional postId; cluster state is kept per (postId, categoryId) for incremental runs
+    Accepts optional refresh (bool) to bypass the report cache
     If categoryId is 'overall' or not provided, analyzes all comments
     Reads draft.txt from current directory
     Fetches comments from API
-    Returns analysis summary
+    Returns analysis summary (blocks until done; see /api/analyze/jobs for the async variant)
     """
+    # Get categoryId from request body
+    request_data = request.get_json() or {}
+    category_id = request_data.get('categoryId', 'overall')
+    post_id = request_data.get('postId', 'default')
+    refresh = bool(request_data.get('refresh', False))
+    
+    print(f"📊 Category ID: {category_id}, Post ID: {post_id}")
+    
     try:
-        start_time = time.time()
-        
-        # Get categoryId from request body
-        request_data = request.get_json() or {}
-        category_id = request_data.get('categoryId', 'overall')
-        
-        print(f"📊 Category ID: {category_id}")
-        
-        # Read draft from file
-        draft_path = os.path.join(os.getcwd(), 'draft.txt')
-        if not os.path.exists(draft_path):
-            return jsonify({
-                'statusCode': 404,
-                'error': 'draft.txt not found in current directory'
-            }), 404
-        
-        with open(draft_path, 'r', encoding='utf-8') as f:
-            draft_text = f.read()
-        
-        print(f"📄 Draft loaded: {len(draft_text)} characters")
-        
-        # Build API URL with categoryId parameter
-        api_url = f"{API_URL}?categoryId={category_id}"
-        
-        # Fetch comments from API with reasonable timeout (5 minutes)
-        print(f"🌐 Fetching comments from: {api_url}")
-        response = requests.get(api_url, timeout=300)  # 5 minute timeout
-        response.raise_for_status()
-        
-        api_data = response.json()
-
-        # Handle different API response structures
-        if isinstance(api_data, list):
-            # Direct list response
-            comments_data = api_data
-        elif isinstance(api_data, dict):
-            if api_data.get('statusCode') != 200:
-                return jsonify({
-                    'statusCode': 400,
-                    'error': 'API returned non-200 status'
-                }), 400
-            
-            # Check if data is directly a list or nested in comments
-            data_field = api_data.get('data', {})
-            if isinstance(data_field, list):
-                comments_data = data_field
-            elif isinstance(data_field, dict):
-                comments_data = data_field.get('comments', [])
-            else:
-                comments_data = []
-        else:
-            comments_data = []
-
-        if not comments_data:
-            return jsonify({
-                'statusCode': 400,
-                'error': 'No comments found in API response'
-            }), 400
-        
-        comments = [item.get('standardComment', '') for item in comments_data]
-        sentiments = [item.get('sentiment', 'Neutral') for item in comments_data]
-        
-        # Filter out empty comments
-        valid_indices = [i for i, c in enumerate(comments) if c and len(c.strip()) > 0]
-        comments = [comments[i] for i in valid_indices]
-        sentiments = [sentiments[i] for i in valid_indices]
-        
-        print(f"💬 Fetched {len(comments)} valid comments")
-        
-        # Run analysis
-        summary = asyncio.run(analyze_comments_async(comments, sentiments, draft_text))
-        
-        elapsed = time.time() - start_time
-        print(f"\n✅ Total time: {elapsed:.2f}s ({elapsed/60:.2f} min)")
-        
+        data = run_on_analysis_loop(build_report(post_id, category_id, refresh=refresh)).result()
         return jsonify({
             'statusCode': 200,
-            'data': {
-                'summary': summary,
-                'metadata': {
-                    'category_id': category_id,
-                    'total_comments': len(comments),
-                    'processing_time_seconds': round(elapsed, 2),
-                    'draft_length': len(draft_text)
-                }
-            }
+            'data': data
         })
-        
-    except requests.RequestException as e:
-        print(f"❌ API Error: {e}")
-        return jsonify({
-            'statusCode': 500,
-            'error': f'Failed to fetch comments from API: {str(e)}'
-        }), 500
     except Exception as e:
-        print(f"❌ Analysis Error: {e}")
-        import traceback
-        traceback.print_exc()
+        status, message = describe_analysis_error(e)
         return jsonify({
-            'statusCode': 500,
-            'error': f'Analysis failed: {str(e)}'
-        }), 500
+            'statusCode': status,
+            'error': message
+        }), status
+
+@app.route('/api/analyze/jobs', methods=['POST'])
+def create_analyze_job():
+    """Start an analysis in the background; same body as /api/analyze. Returns the job ID"""
+    request_data = request.get_json() or {}
+    job = create_analysis_job(
+        request_data.get('postId', 'default'), request_data.get('categoryId', 'overall'),
+        refresh=bool(request_data.get('refresh', False))
+    )
+    print(f"🧾 Analysis job {job['id']} queued for category {job['categoryId']}")
+    return jsonify({
+        'statusCode': 202,
+        'data': {'jobId': job['id'], 'status': job['status']}
+    }), 202
+
+@app.route('/api/analyze/jobs/<job_id>', methods=['GET'])
+def get_analyze_job(job_id):
+    """Job status, per-stage progress and, once completed, the same data /api/analyze returns"""
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'statusCode': 404, 'error': 'Job not found'}), 404
+    return jsonify({'statusCode': 200, 'data': job_view(job)})
+
+@app.route('/api/analyze/jobs/<job_id>/events', methods=['GET'])
+def stream_analyze_job(job_id):
+    """SSE progress stream for a job"""
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'statusCode': 404, 'error': 'Job not found'}), 404
+    return Response(
+        job_event_stream(job),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/health', methods=['GET'])
 def health():
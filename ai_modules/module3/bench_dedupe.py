@@ -0,0 +1,126 @@
+"""Benchmark the blocked dedupe engine (dedupe.py) against the previous implementation.
+
+Synthetic clusters are built from a few hundred "campaign" texts, each repeated with small
+noise, plus unique comments. Checks that results match the old exact path on small clusters,
+then times both engines per cluster size (the old one only up to --legacy-max):
+
+    python bench_dedupe.py --sizes 50 500 2000 10000 50000 --output dedupe_bench.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.neighbors import NearestNeighbors
+
+from dedupe import semantic_dedupe_fast
+
+
+def legacy_semantic_dedupe(indices, embeddings_array, threshold=0.92):
+    """Previous module3 implementation, kept verbatim for comparison"""
+    """Faster deduplication using approximate nearest neighbors"""
+    if len(indices) <= 1:
+        return indices
+    
+    vecs = embeddings_array[indices]
+    m = vecs.shape[0]
+    
+    # For small clusters, use exact method
+    if m <= 50:
+        sim = cosine_similarity(vecs)
+        parent = list(range(m))
+        
+        def find(x):
+            if parent[x] != x:
+                parent[x] = find(parent[x])
+            return parent[x]
+        
+        def union(x, y):
+            px, py = find(x), find(y)
+            if px != py:
+                parent[px] = py
+        
+        for i in range(m):
+            for j in range(i+1, m):
+                if sim[i, j] >= threshold:
+                    union(i, j)
+        
+        groups = {}
+        for i in range(m):
+            root = find(i)
+            if root not in groups:
+                groups[root] = i
+        
+        return [indices[i] for i in sorted(groups.values())]
+    
+    # For large clusters, use approximate method
+    kept = [0]  # Always keep first
+    nn = NearestNeighbors(n_neighbors=min(10, m), metric='cosine', algorithm='brute')
+    nn.fit(vecs)
+    
+    for i in range(1, m):
+        distances, _ = nn.kneighbors([vecs[i]], n_neighbors=min(len(kept)+1, 10))
+        min_dist = distances[0][0] if len(distances[0]) > 0 else 1.0
+        similarity = 1 - min_dist
+        
+        if similarity < threshold:
+            kept.append(i)
+    
+    return [indices[i] for i in kept]
+
+
+def synthetic_cluster(m, dim=768, duplicate_share=0.6, seed=0):
+    """m embeddings where about duplicate_share of rows are noisy copies of a few templates"""
+    rng = np.random.default_rng(seed)
+    n_dup = int(m * duplicate_share)
+    templates = rng.standard_normal((max(1, n_dup // 20), dim)).astype(np.float32)
+    dups = templates[rng.integers(0, len(templates), n_dup)]
+    dups = dups + 0.05 * rng.standard_normal(dups.shape).astype(np.float32)
+    unique = rng.standard_normal((m - n_dup, dim)).astype(np.float32)
+    E = np.vstack([dups, unique])
+    return E[rng.permutation(m)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic dedupe benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 2000, 10000, 50000])
+    parser.add_argument("--legacy-max", type=int, default=5000, help="largest size to run the old engine on")
+    parser.add_argument("--threshold", type=float, default=0.92)
+    parser.add_argument("--output", default=None, help="optional JSON results path")
+    args = parser.parse_args()
+
+    # Parity with the old exact path (clusters of <= 50 comments)
+    for seed in range(20):
+        E = synthetic_cluster(50, seed=seed)
+        idxs = list(range(50))
+        assert legacy_semantic_dedupe(idxs, E, args.threshold) == semantic_dedupe_fast(idxs, E, args.threshold), \
+            f"mismatch on small cluster (seed {seed})"
+    print("small-cluster parity: OK (20 clusters of 50)")
+
+    results = []
+    for m in args.sizes:
+        E = synthetic_cluster(m)
+        idxs = list(range(m))
+        kept, new_s = timed(semantic_dedupe_fast, idxs, E, args.threshold)
+        row = {"size": m, "kept": len(kept), "blocked_s": round(new_s, 4)}
+        if m <= args.legacy_max:
+            legacy_kept, legacy_s = timed(legacy_semantic_dedupe, idxs, E, args.threshold)
+            row.update({"legacy_kept": len(legacy_kept), "legacy_s": round(legacy_s, 4),
+                        "speedup": round(legacy_s / new_s, 1) if new_s else None})
+        results.append(row)
+        print(row)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Persisted cluster state for incremental module3 runs.
+
+After a full clustering run the fitted model, the reducer, the scaler and the comment -> cluster assignments
+(keyed by embedding cache key) are saved per (postId, categoryId) under CLUSTER_STATE_DIR. The next
+run keeps the stored labels for comments it has seen before, folds the new ones into the model with
+MiniBatchKMeans.partial_fit and assigns them to the nearest centroid. A full recluster is requested
+instead when the new comments drift too far from the existing clusters:
+
+- INCREMENTAL_MAX_NEW_FRACTION: comments added since the last full fit, relative to its size
+- INCREMENTAL_DRIFT_RATIO: mean squared distance of new comments to their centroid, relative to
+  the same figure at fit time
+- INCREMENTAL_CENTROID_SHIFT: largest centroid move caused by partial_fit, in units of the
+  fit-time RMS distance
+"""
+import os
+import re
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+INCREMENTAL_CLUSTERING = os.getenv("INCREMENTAL_CLUSTERING", "1") == "1"
+CLUSTER_STATE_DIR = os.getenv("CLUSTER_STATE_DIR", "cluster_state")
+INCREMENTAL_MAX_NEW_FRACTION = float(os.getenv("INCREMENTAL_MAX_NEW_FRACTION", 0.25))
+INCREMENTAL_DRIFT_RATIO = float(os.getenv("INCREMENTAL_DRIFT_RATIO", 1.5))
+INCREMENTAL_CENTROID_SHIFT = float(os.getenv("INCREMENTAL_CENTROID_SHIFT", 0.25))
+
+
+def cluster_state_path(post_id, category_id):
+    safe = lambda v: re.sub(r"[^A-Za-z0-9_.-]", "_", str(v))
+    return os.path.join(CLUSTER_STATE_DIR, f"{safe(post_id)}__{safe(category_id)}.joblib")
+
+
+def load_cluster_state(post_id, category_id):
+    """Stored state for this post/category, or None if there is none (or it cannot be read)"""
+    path = cluster_state_path(post_id, category_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        return joblib.load(path)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable cluster state {path}: {str(e)[:200]}")
+        return None
+
+
+def write_cluster_state(post_id, category_id, state):
+    os.makedirs(CLUSTER_STATE_DIR, exist_ok=True)
+    path = cluster_state_path(post_id, category_id)
+    # A temp file per write, so concurrent runs for the same post/category never share one
+    fd, tmp = tempfile.mkstemp(dir=CLUSTER_STATE_DIR, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            joblib.dump(state, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def build_cluster_state(model, scaler, X, labels, keys, reducer=None, reducer_config=None):
+    """Fresh state after a full fit; the baseline distance is what later drift is measured against"""
+    labels = np.asarray(labels)
+    sq_dist = ((X - model.cluster_centers_[labels]) ** 2).sum(axis=1)
+    return {
+        "model": model,
+        "scaler": scaler,
+        "reducer": reducer,
+        "reducer_config": reducer_config,
+        "assignments": dict(zip(keys, labels.tolist())),
+        "baseline_sq_dist": float(sq_dist.mean()) or 1e-12,
+        "n_at_fit": len(keys),
+        "n_added": 0,
+        "fitted_at": time.time(),
+    }
+
+
+def assign_incremental(state, E, keys, weights=None):
+    """Label comments from the stored state, updating it in place.
+    weights (exact-duplicate counts) weight the partial_fit update.
+
+    Returns (labels, metrics). labels is None when a full recluster is needed; metrics['reason']
+    then says why. The state must not be saved in that case.
+    """
+    assignments = state["assignments"]
+    model = state["model"]
+    new_idx = [i for i, k in enumerate(keys) if k not in assignments]
+    n_added = state["n_added"] + len(new_idx)
+    metrics = {
+        "known_comments": len(keys) - len(new_idx),
+        "new_comments": len(new_idx),
+        "added_fraction": round(n_added / max(1, state["n_at_fit"]), 4),
+    }
+
+    if not hasattr(model, "partial_fit"):
+        return None, {**metrics, "reason": "stored model does not support partial_fit"}
+    if metrics["added_fraction"] > INCREMENTAL_MAX_NEW_FRACTION:
+        return None, {**metrics, "reason": "too many comments added since the last full fit"}
+
+    labels = np.array([assignments.get(k, -1) for k in keys])
+    if new_idx:
+        X_new = state["scaler"].transform(E[new_idx])
+        old_centers = model.cluster_centers_.copy()
+
+        nearest = model.predict(X_new)
+        new_sq_dist = float(((X_new - old_centers[nearest]) ** 2).sum(axis=1).mean())
+        metrics["distance_ratio"] = round(new_sq_dist / state["baseline_sq_dist"], 4)
+        if metrics["distance_ratio"] > INCREMENTAL_DRIFT_RATIO:
+            return None, {**metrics, "reason": "new comments are far from the existing clusters"}
+
+        model.partial_fit(X_new, sample_weight=None if weights is None else np.asarray(weights)[new_idx])
+        shift = np.sqrt(((model.cluster_centers_ - old_centers) ** 2).sum(axis=1)).max()
+        metrics["centroid_shift"] = round(float(shift / np.sqrt(state["baseline_sq_dist"])), 4)
+        if metrics["centroid_shift"] > INCREMENTAL_CENTROID_SHIFT:
+            return None, {**metrics, "reason": "centroids moved too far"}
+
+        labels[new_idx] = model.predict(X_new)
+        assignments.update(zip((keys[i] for i in new_idx), labels[new_idx].tolist()))
+        state["n_added"] = n_added
+
+    return labels, metrics
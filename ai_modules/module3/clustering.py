@@ -0,0 +1,139 @@
+"""Parallel k-sweep for module3 cluster selection.
+
+The first candidate k is fitted on its own; the rest are fitted in waves of KSWEEP_WORKERS on a
+joblib process pool (large arrays are memory-mapped to the workers rather than copied). Each later
+candidate is warm-started from the first candidate's centroids (extended k-means++ style) with a
+single init, instead of the 3 (MiniBatchKMeans) or 5 (KMeans) k-means++ inits. Results are read in k
+order and the sweep stops once KSWEEP_PATIENCE candidates in a row fail to improve the best
+silhouette score by KSWEEP_MIN_IMPROVEMENT, so the outcome does not depend on the worker count.
+
+The sharded helpers at the bottom fit and apply a MiniBatchKMeans shard by shard for the
+out-of-core analysis mode, where the embeddings live in a memmap.
+"""
+import os
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from sklearn.metrics.pairwise import euclidean_distances
+
+KSWEEP_WORKERS = int(os.getenv("KSWEEP_WORKERS", os.cpu_count() or 1))
+KSWEEP_MIN_IMPROVEMENT = float(os.getenv("KSWEEP_MIN_IMPROVEMENT", 0.005))
+KSWEEP_PATIENCE = int(os.getenv("KSWEEP_PATIENCE", 2))
+
+
+def warm_start_centers(X, prev_centers, k, seed=42, sample_size=1024):
+    """Previous centroids plus k-means++ style picks for the extra clusters (None if not applicable).
+    The picks are seeded on a row sample, as MiniBatchKMeans does for its own k-means++ init."""
+    if prev_centers is None or len(prev_centers) >= k:
+        return None
+    rng = np.random.default_rng(seed)
+    S = X if len(X) <= sample_size else X[rng.choice(len(X), sample_size, replace=False)]
+    sq_norms = np.einsum("ij,ij->i", S, S)
+    centers = [c for c in prev_centers]
+    min_d = euclidean_distances(S, prev_centers, squared=True, X_norm_squared=sq_norms[:, None]).min(axis=1)
+    for _ in range(k - len(prev_centers)):
+        total = min_d.sum()
+        i = int(rng.choice(len(S), p=min_d / total)) if total > 0 else int(rng.integers(len(S)))
+        centers.append(S[i])
+        min_d = np.minimum(min_d, np.maximum(sq_norms - 2 * (S @ S[i]) + sq_norms[i], 0))
+    return np.vstack(centers).astype(X.dtype)
+
+
+def _fit_kmeans(X, k, init, n_init, sample_weight):
+    # Use MiniBatchKMeans for large datasets (much faster)
+    if X.shape[0] > 500:
+        km = MiniBatchKMeans(n_clusters=k, batch_size=256, init=init, n_init=n_init, random_state=42, max_iter=100)
+    else:
+        km = KMeans(n_clusters=k, init=init, n_init=n_init, random_state=42)
+    return km.fit(X, sample_weight=sample_weight)
+
+
+def fit_candidate_k(X, k, init, sample_idx, sample_weight=None):
+    """Fit one candidate k and score it on the silhouette sample.
+    init (warm-start centroids) replaces the k-means++ inits with a single run; None uses k-means++."""
+    start = time.time()
+    result = {"k": k, "warm_start": init is not None, "score": None, "labels": None, "centers": None, "model": None}
+    try:
+        if init is not None:
+            km = _fit_kmeans(X, k, init, 1, sample_weight)
+        else:
+            km = _fit_kmeans(X, k, "k-means++", 3 if X.shape[0] > 500 else 5, sample_weight)
+        labels = km.labels_
+        result.update(labels=labels, centers=km.cluster_centers_, model=km)
+
+        if len(set(labels)) >= 2:
+            # Calculate silhouette score on sample only
+            result["score"] = float(silhouette_score(
+                X[sample_idx], labels[sample_idx], sample_size=min(500, len(sample_idx)), random_state=42
+            ))
+    except Exception as e:
+        result["error"] = str(e)[:200]
+    result["fit_s"] = round(time.time() - start, 3)
+    return result
+
+
+def sweep_k(X, candidate_ks, sample_idx, workers=KSWEEP_WORKERS, sample_weight=None):
+    """Returns (best result or None, per-k report, stopped_early)
+    sample_weight (e.g. exact-duplicate counts) weights the k-means fits, not the silhouette score"""
+    workers = max(1, min(workers, len(candidate_ks)))
+    best, stale, stopped_early = None, 0, False
+    report = []
+
+    with Parallel(n_jobs=workers) as parallel:
+        results = [fit_candidate_k(X, candidate_ks[0], None, sample_idx, sample_weight)]
+        anchor = results[0]["centers"]
+        seen = 0
+        while True:
+            # Early stopping is decided in k order; fits past the stopping point are discarded
+            for r in results:
+                seen += 1
+                report.append({k: r[k] for k in ("k", "score", "fit_s", "warm_start", "error") if k in r})
+                if r.get("error"):
+                    print(f"   ⚠️ K={r['k']} failed: {r['error']}")
+
+                if r["score"] is not None and (best is None or r["score"] > best["score"] + KSWEEP_MIN_IMPROVEMENT):
+                    best, stale = r, 0
+                    continue
+                if r["score"] is not None and r["score"] > best["score"]:
+                    best = r
+                stale += 1
+                if stale >= KSWEEP_PATIENCE and seen < len(candidate_ks):
+                    stopped_early = True
+                    break
+
+            if stopped_early or seen >= len(candidate_ks):
+                break
+            wave = candidate_ks[seen:seen+workers]
+            results = parallel(
+                delayed(fit_candidate_k)(X, k, warm_start_centers(X, anchor, k), sample_idx, sample_weight) for k in wave
+            )
+
+    return best, report, stopped_early
+
+
+def iter_shards(rows, shard_rows):
+    for s in range(0, len(rows), shard_rows):
+        yield rows[s:s+shard_rows]
+
+
+def fit_kmeans_sharded(transform, rows, weights, init_centers, shard_rows, epochs=1, seed=42):
+    """MiniBatchKMeans started from init_centers and updated with partial_fit one shard at a time.
+    transform(row_indices) returns the feature matrix for those rows, so only one shard is ever
+    materialized; weights are per-row sample weights (or None)."""
+    km = MiniBatchKMeans(n_clusters=len(init_centers), init=init_centers, n_init=1,
+                         batch_size=256, random_state=seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(epochs):
+        # Shuffled shard order so the centroids are not pulled toward whatever was fetched last
+        shards = list(iter_shards(rows, shard_rows))
+        for i in rng.permutation(len(shards)):
+            shard = shards[i]
+            km.partial_fit(transform(shard), sample_weight=None if weights is None else weights[shard])
+    return km
+
+
+def predict_sharded(km, transform, rows, shard_rows):
+    return np.concatenate([km.predict(transform(shard)) for shard in iter_shards(rows, shard_rows)])
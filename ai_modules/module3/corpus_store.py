@@ -0,0 +1,97 @@
+"""On-disk comment corpus for module3's sharded (out-of-core) analysis mode.
+
+Unique comment texts (exact duplicates collapsed with a submission count, see dedupe.py) go into a
+temporary SQLite file, and their embeddings are appended to a float16 file that is opened as a
+read-only memmap for clustering. Rows are numbered in insertion order, so row i of the memmap is
+text id i + 1. Nothing per-comment is kept in Python objects; the only per-comment arrays are the
+integer weights, labels and failure mask the analysis builds on top.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+
+from dedupe import exact_duplicate_key
+
+SHARDED_WORK_DIR = os.getenv("SHARDED_WORK_DIR") or None  # None = system temp dir
+
+
+class ShardedCorpus:
+    def __init__(self, directory=SHARDED_WORK_DIR):
+        self.dir = tempfile.mkdtemp(prefix="module3-corpus-", dir=directory)
+        self.db = sqlite3.connect(os.path.join(self.dir, "texts.db"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=OFF")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute(
+            "CREATE TABLE texts (id INTEGER PRIMARY KEY, dup_key TEXT UNIQUE NOT NULL, "
+            "text TEXT NOT NULL, weight INTEGER NOT NULL DEFAULT 1)"
+        )
+        self.vectors_path = os.path.join(self.dir, "embeddings.f16")
+        self._vectors = open(self.vectors_path, "wb")
+        self.count = 0          # unique texts
+        self.rows_written = 0   # embedding rows appended so far
+        self.dim = None
+        self.failed = bytearray()  # 1 per row that could not be embedded
+        self._pending_failed = 0   # failures seen before the first vector fixed the dimension
+
+    def add(self, texts):
+        """Add one page of texts; returns (row, text) for the ones not seen before, in row order"""
+        new = []
+        for text in texts:
+            key = exact_duplicate_key(text)
+            if self.db.execute("UPDATE texts SET weight = weight + 1 WHERE dup_key = ?", (key,)).rowcount:
+                continue
+            self.db.execute("INSERT INTO texts (id, dup_key, text) VALUES (?, ?, ?)", (self.count + 1, key, text))
+            new.append((self.count, text))
+            self.count += 1
+        self.db.commit()
+        return new
+
+    def append_embeddings(self, vectors):
+        """Append vectors for the next rows, in row order; None marks a row that failed to embed"""
+        for vec in vectors:
+            if vec is None:
+                self.failed.append(1)
+                if self.dim is None:
+                    self._pending_failed += 1
+                else:
+                    self._vectors.write(np.zeros(self.dim, dtype=np.float16).tobytes())
+            else:
+                vec = np.asarray(vec, dtype=np.float16)
+                if self.dim is None:
+                    self.dim = len(vec)
+                    self._vectors.write(np.zeros((self._pending_failed, self.dim), dtype=np.float16).tobytes())
+                    self._pending_failed = 0
+                self.failed.append(0)
+                self._vectors.write(vec.tobytes())
+            self.rows_written += 1
+
+    def embeddings(self):
+        """Read-only (rows, dim) float16 memmap over everything appended so far"""
+        self._vectors.flush()
+        if self.dim is None or not self.rows_written:
+            return np.zeros((self.rows_written, 0), dtype=np.float16)
+        return np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(self.rows_written, self.dim))
+
+    def weights(self):
+        rows = self.db.execute("SELECT weight FROM texts ORDER BY id").fetchall()
+        return np.fromiter((w for (w,) in rows), dtype=np.int64, count=len(rows))
+
+    def texts(self, rows, chunk=500):
+        """Texts for the given rows, in the same order"""
+        rows = [int(r) for r in rows]
+        found = {}
+        for i in range(0, len(rows), chunk):
+            part = [r + 1 for r in rows[i:i+chunk]]
+            for text_id, text in self.db.execute(
+                f"SELECT id, text FROM texts WHERE id IN ({','.join('?' * len(part))})", part
+            ):
+                found[text_id - 1] = text
+        return [found[r] for r in rows]
+
+    def close(self):
+        self._vectors.close()
+        self.db.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
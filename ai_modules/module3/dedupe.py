@@ -0,0 +1,93 @@
+"""Blocked, vectorized semantic deduplication for module3 clusters.
+
+Comments are L2-normalized once, cosine similarities are computed block by block with matrix
+multiplies (at most DEDUPE_BLOCK_ELEMENTS similarities in memory at a time) and every pair at or
+above the threshold is merged with a vectorized union-find. Each connected group keeps its
+first comment, exactly like the original exact O(m^2) path, but it scales to 50k-comment clusters.
+
+Exact duplicates (same text up to case, whitespace and punctuation) are collapsed before
+embedding by exact_duplicate_groups, so campaign comments are embedded and clustered once.
+"""
+import os
+import string
+import hashlib
+import numpy as np
+
+DEDUPE_BLOCK_ELEMENTS = int(os.getenv("DEDUPE_BLOCK_ELEMENTS", 8_000_000))
+
+
+# ASCII punctuation plus the Unicode quotes, dashes and danda that show up in pasted comments
+_PUNCT_TABLE = str.maketrans("", "", string.punctuation + "\u2018\u2019\u201c\u201d\u2013\u2014\u2026\u0964\u0965")
+
+
+def normalize_comment(text):
+    """Case-folded text without punctuation and with whitespace collapsed"""
+    return " ".join(text.casefold().translate(_PUNCT_TABLE).split())
+
+
+def exact_duplicate_key(text):
+    return hashlib.sha1(normalize_comment(text).encode("utf-8")).hexdigest()
+
+
+def exact_duplicate_groups(texts):
+    """Group texts that are identical after normalization.
+    Returns (first index of each group in input order, group of every text, group sizes)"""
+    first, group_of, groups = [], np.empty(len(texts), dtype=np.int64), {}
+    for i, text in enumerate(texts):
+        g = groups.setdefault(exact_duplicate_key(text), len(first))
+        if g == len(first):
+            first.append(i)
+        group_of[i] = g
+    return first, group_of, np.bincount(group_of, minlength=len(first))
+
+
+def _compress(parent):
+    """Pointer jumping until every node points straight at its root"""
+    while True:
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            return
+        parent[:] = grand
+
+
+def _union_edges(parent, u, v):
+    """Union all (u, v) pairs; roots always hook under the smaller index, so every group's
+    root is its smallest member. `parent` must be compressed on entry and is on exit."""
+    while u.size:
+        ru, rv = parent[u], parent[v]
+        differ = ru != rv
+        if not differ.any():
+            return
+        u, v, ru, rv = u[differ], v[differ], ru[differ], rv[differ]
+        np.minimum.at(parent, np.maximum(ru, rv), np.minimum(ru, rv))
+        _compress(parent)
+
+
+def semantic_dedupe_fast(indices, embeddings_array, threshold=0.92):
+    """Keep the first comment of every group whose cosine similarities chain at or above threshold"""
+    if len(indices) <= 1:
+        return indices
+
+    vecs = np.asarray(embeddings_array[indices], dtype=np.float32)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vecs = vecs / norms
+
+    m = vecs.shape[0]
+    parent = np.arange(m)
+    block = max(1, DEDUPE_BLOCK_ELEMENTS // m)
+
+    for start in range(0, m, block):
+        stop = min(start + block, m)
+        # Only the upper triangle: rows start..stop against columns start..m
+        sim = vecs[start:stop] @ vecs[start:].T
+        rows, cols = np.nonzero(sim >= threshold)
+        rows += start
+        cols += start
+        upper = cols > rows
+        u, v = rows[upper], cols[upper]
+        # Pairs already in the same group need no work
+        pending = parent[u] != parent[v]
+        _union_edges(parent, u[pending], v[pending])
+
+    return [indices[i] for i in np.unique(parent)]
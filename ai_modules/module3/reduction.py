@@ -0,0 +1,71 @@
+"""Optional dimensionality reduction before module3 clustering.
+
+REDUCE_METHOD picks how the 768-dim embeddings are made compact before k-means, silhouette scoring
+and semantic dedupe:
+
+- none: cluster the full embeddings (default)
+- pca: randomized PCA fitted on up to REDUCE_FIT_SAMPLE rows (uncentered, i.e. TruncatedSVD, so
+  cosine similarities for semantic dedupe keep their meaning)
+- random_projection: Gaussian random projection (data independent, cheapest)
+- output_dim: ask the embedding model for REDUCE_DIM-dim vectors (no reducer here; see app.py)
+
+The fitted reducer is stored with the cluster state so incremental runs project new comments into
+the same space. reduction_quality() measures what the reduction costs on a sample of the original
+embeddings: the silhouette (cosine, full space) of the reduced-space labels against labels from
+k-means fitted on the full-space sample itself. With output_dim there are no full-space embeddings,
+so the run metadata reports the quality as unavailable.
+"""
+import os
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.metrics import silhouette_score
+from sklearn.random_projection import GaussianRandomProjection
+
+REDUCE_METHOD = os.getenv("REDUCE_METHOD", "none").lower()
+REDUCE_DIM = int(os.getenv("REDUCE_DIM", 128))
+REDUCE_FIT_SAMPLE = int(os.getenv("REDUCE_FIT_SAMPLE", 20000))
+REDUCE_QUALITY_SAMPLE = int(os.getenv("REDUCE_QUALITY_SAMPLE", 2000))  # 0 = skip the quality check
+
+
+def reducer_config():
+    """What a stored reducer must match to be reused"""
+    return {"method": REDUCE_METHOD, "dim": REDUCE_DIM}
+
+
+def fit_reducer(E, seed=42):
+    """Fitted reducer for the configured method, or None when E is clustered as it is"""
+    if REDUCE_METHOD not in ("pca", "random_projection") or E.shape[1] <= REDUCE_DIM:
+        return None
+    n_components = min(REDUCE_DIM, E.shape[0] - 1)
+    if REDUCE_METHOD == "pca":
+        reducer = TruncatedSVD(n_components=n_components, algorithm="randomized", random_state=seed)
+        rows = E
+        if len(E) > REDUCE_FIT_SAMPLE:
+            rows = E[np.random.default_rng(seed).choice(len(E), REDUCE_FIT_SAMPLE, replace=False)]
+        reducer.fit(rows)
+    else:
+        reducer = GaussianRandomProjection(n_components=n_components, random_state=seed).fit(E[:1])
+    return reducer
+
+
+def apply_reducer(reducer, E):
+    if reducer is None:
+        return E
+    return np.ascontiguousarray(reducer.transform(E), dtype=np.float32)
+
+
+def reduction_quality(E_sample, labels_sample, k, seed=42):
+    """Cluster quality on the original embeddings: reduced-space labels vs a full-space fit"""
+    if len(set(labels_sample)) < 2 or len(E_sample) <= k:
+        return None
+    full_labels = KMeans(n_clusters=k, n_init=3, random_state=seed).fit_predict(E_sample)
+    reduced_score = float(silhouette_score(E_sample, labels_sample, metric="cosine"))
+    full_score = float(silhouette_score(E_sample, full_labels, metric="cosine"))
+    return {
+        "sample": len(E_sample),
+        "silhouette_reduced": round(reduced_score, 4),
+        "silhouette_full": round(full_score, 4),
+        "delta": round(reduced_score - full_score, 4),
+    }
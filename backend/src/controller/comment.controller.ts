@@ -439,7 +439,7 @@ const getAllCommentsWithSentimentCSV = asyncHandler(async (req: Request, res: Re
 
 const getAllCommentsWithSentiment = asyncHandler(async (req: Request, res: Response) => {
   try {
-    const { categoryId } = req.query;
+    const { categoryId, limit, cursor } = req.query;
 
     // Build where clause based on categoryId
     const whereClause: any = { status: 'ANALYZED' };
@@ -450,9 +450,18 @@ const getAllCommentsWithSentiment = asyncHandler(async (req: Request, res: Respo
     }
     // If categoryId is "overall" or not provided, fetch all comments (no additional filter)
 
+    // Optional cursor pagination: ?limit=N[&cursor=<nextCursor from the previous page>]
+    // Without limit, every matching comment is returned in one response
+    const pageSize = limit ? parseInt(limit as string) : 0;
+    const pagination: any = pageSize > 0 ? {
+      take: pageSize + 1,
+      ...(cursor ? { cursor: { id: cursor as string }, skip: 1 } : {})
+    } : {};
+
     const comments = await prisma.comment.findMany({
       where: whereClause,
       select: {
+        id: true,
         standardComment: true,
         sentiment: true,
         businessCategoryId: true,
@@ -468,13 +477,19 @@ const getAllCommentsWithSentiment = asyncHandler(async (req: Request, res: Respo
           }
         }
       },
-      orderBy: { updatedAt: 'desc' }
+      // Immutable sort keys: re-analysis bumps updatedAt, which would move rows across pages
+      orderBy: [{ createdAt: 'desc' }, { id: 'desc' }],
+      ...pagination
     });
 
+    const hasMore = pageSize > 0 && comments.length > pageSize;
+    const page = hasMore ? comments.slice(0, pageSize) : comments;
+
     res.status(200).json(new ApiResponse(200, {
-      total: comments.length,
+      total: page.length,
       categoryId: categoryId || 'overall',
-      comments
+      comments: page,
+      nextCursor: hasMore ? page[page.length - 1].id : null
     }, "Comments with sentiment fetched successfully"));
   } catch (error) {
     console.error("Error fetching all comments:", error);
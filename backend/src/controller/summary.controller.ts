@@ -58,7 +58,7 @@ export const addPostSummary = asyncHandler(async (req: Request, res: Response) =
       // Call Python API for AI-generated summary
       const summaryResponse = await axios.post(
         `${SUMMARY_API_URL}/api/analyze`,
-        { categoryId: category.id },
+        { categoryId: category.id, postId },
         { 
           timeout: 600000, // 10 minutes timeout for AI processing
           headers: { 'Content-Type': 'application/json' }
@@ -615,7 +615,7 @@ export const generateOverallSummary = asyncHandler(async (req: Request, res: Res
     // Call Python API for AI-generated overall summary
     const summaryResponse = await axios.post(
       `${SUMMARY_API_URL}/api/analyze`,
-      { categoryId: "overall" },
+      { categoryId: "overall", postId },
       { 
         timeout: 600000, // 10 minutes timeout for AI processing
         headers: { 'Content-Type': 'application/json' }
@@ -421,6 +421,7 @@ export const processRawComments = inngest.createFunction(
             `${process.env.MODEL2_API_URL}/analyze`,
             { comment: comment.rawComment,
               commentType: comment.commentType,
+              postId: comment.postId,
              },
             { timeout: 60000 }
           );